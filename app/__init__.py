@@ -1,29 +1,68 @@
-from datetime import timedelta
-import os
 from flask import Flask
 from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
-from pymongo import MongoClient
+
+from .config import load_config
+from .database import MongoDatabase
+from .metrics import init_metrics
+from .serialization import FastJSONProvider
 
 
 load_dotenv()
 
-app = Flask(__name__)
+db = MongoDatabase()
+
+
+def create_app(config=None):
+    """
+    Build the Flask application.
 
-CORS(app)
+    Settings come from the environment (see `app.config.load_config`) and can
+    be overridden with `config`. Indexes are created by `flask indexes ensure`
+    (or, best effort, at startup with ENSURE_INDEXES=1). The Mongo client itself is only opened on
+    first use in each process, so the app can be created before forking.
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
 
-app.config["SECRET_KEY"] = "uwenndknsksdieewo"
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=7)
+    CORS(app, expose_headers=["ETag"])
+    JWTManager(app)
+    db.init_app(app)
+    if app.config["METRICS_ENABLED"]:
+        init_metrics(app)
 
-client = MongoClient("localhost", 27017)
+    from .aio import ASYNC_VIEWS
+    from .cache import report_cache
+    from .rates import rate_table
+    from .roster import roster_cache
+    from .indexes import ensure_indexes, indexes_cli
+    from .shifts.routes import shifts
+    from .report.routes import report
+    from .authentication.routes import auth
 
-db = client.hrportal
+    report_cache.init_app(app)
+    rate_table.init_app(app)
+    roster_cache.init_app(app)
 
+    app.cli.add_command(indexes_cli)
+    app.register_blueprint(shifts, url_prefix="/shifts")
+    app.register_blueprint(report, url_prefix="/report")
+    app.register_blueprint(auth, url_prefix="/auth")
+    if not ASYNC_VIEWS:
+        app.logger.warning("asgiref is not installed (pip install 'flask[async]'): "
+                           "/shifts/dashboard and /shifts/history are not served")
 
-from .shifts.routes import shifts
-from .report.routes import report
-from .authentication.routes import auth
+    if app.config["ENSURE_INDEXES"]:
+        # Best effort only: never keep the app from starting.
+        try:
+            for failure in ensure_indexes():
+                app.logger.error("Index %s on %s not created: %s", failure["keys"], failure["collection"], failure["error"])
+        except PyMongoError as e:
+            app.logger.error("Could not ensure indexes: %s", e)
 
-app.register_blueprint(shifts, url_prefix="/shifts")
-app.register_blueprint(report, url_prefix="/report")
-app.register_blueprint(auth, url_prefix="/auth")
\ No newline at end of file
+    return app
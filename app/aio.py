@@ -0,0 +1,218 @@
+import asyncio
+import importlib.util
+import itertools
+import os
+import threading
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient
+
+from app import db
+from app.metrics import bind_request_stats
+from app.rates import rate_table
+from app.roster import EMPLOYEES_VERSION_ID, ROSTER_PROJECTION, roster_cache
+from app.shifts.codec import CODE_FIELDS, decode_document
+
+TEAMS_DOCUMENT_ID = ObjectId("673852c639119f5963cd46d8")
+
+# Flask runs `async def` views through asgiref (the flask[async] extra).
+ASYNC_VIEWS = importlib.util.find_spec("asgiref") is not None
+
+
+class AsyncMongoDatabase:
+    """
+    Asyncio access to the same database as `app.db`.
+
+    The AsyncMongoClient lives on one event loop running in a background
+    thread per process (restarted after a fork), so its pool is shared by
+    every request instead of being rebuilt for each loop Flask creates for
+    an async view. Coroutines are handed to that loop with `run` from
+    synchronous code or awaited with `call` from async views.
+
+    When `app.db` serves a stand-in client (`use_client`, e.g. mongomock),
+    the coroutines read it through `BlockingDatabase` on the same loop.
+    """
+
+    def __init__(self, sync_db):
+        self.sync_db = sync_db
+        self.loop = None
+        self.client = None
+        self.name = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def ensure_loop(self):
+        pid = os.getpid()
+        if self.loop is None or self.pid != pid:
+            with self.lock:
+                if self.loop is None or self.pid != pid:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="mongo-async", daemon=True).start()
+                    uri, self.name, options = self.sync_db.settings
+                    self.client = asyncio.run_coroutine_threadsafe(self.create_client(uri, options), loop).result()
+                    self.loop, self.pid = loop, pid
+        return self.loop
+
+    @staticmethod
+    async def create_client(uri, options):
+        return AsyncMongoClient(uri, **options)
+
+    @property
+    def database(self):
+        standin = self.sync_db.standin
+        if standin is not None:
+            return BlockingDatabase(standin)
+        self.ensure_loop()
+        return self.client[self.name]
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(bind_request_stats(coro), self.ensure_loop())
+
+    def run(self, coro):
+        """Run a data-layer coroutine from synchronous code and return its result."""
+        return self.submit(coro).result()
+
+    async def call(self, coro):
+        """Await a data-layer coroutine from an async view running on another event loop."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+
+class BlockingCursor:
+    """The async cursor methods the data layer uses, over a synchronous cursor."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, count):
+        self.cursor = self.cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        return list(itertools.islice(self.cursor, length))
+
+
+class BlockingCollection:
+    """The async collection methods the data layer uses, over a synchronous collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return BlockingCursor(self.collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    async def aggregate(self, *args, **kwargs):
+        return BlockingCursor(self.collection.aggregate(*args, **kwargs))
+
+
+class BlockingDatabase:
+    """Serves the async data layer from a synchronous stand-in database."""
+
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, name):
+        return BlockingCollection(self.database[name])
+
+    def __getattr__(self, name):
+        return BlockingCollection(self.database[name])
+
+
+adb = AsyncMongoDatabase(db)
+
+
+async def fetch_roster(team):
+    version = roster_cache.fresh_version()
+    if version is None:
+        doc = await adb.database.data_version.find_one({"_id": EMPLOYEES_VERSION_ID})
+        version = roster_cache.note_version(doc.get("version", 0) if doc else 0)
+    roster = roster_cache.cached(team, version)
+    if roster is None:
+        rows = await adb.database.employees.find({"team": team}, ROSTER_PROJECTION).to_list(None)
+        roster = roster_cache.store(team, {data.get('unique_id'): data.get('name') for data in rows}, version)
+    return roster
+
+
+async def fetch_rates():
+    snapshot = rate_table.fresh()
+    if snapshot is None:
+        snapshot = rate_table.load(await adb.database.allowance.find({}, {'_id': 0}).to_list(None))
+    return snapshot
+
+
+async def fetch_grid_state(team, month, year):
+    """
+    Return `(count, revision)` for the team's month: the number of shifts
+    documents and the highest revision among them, read from the index
+    without loading any day maps.
+    """
+    cursor = await adb.database.shifts.aggregate([
+        {"$match": {'team': team, 'month': int(month), 'year': int(year)}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "revision": {"$max": "$revision"}}},
+    ])
+    states = await cursor.to_list(1)
+    if not states:
+        return 0, 0
+    return states[0]["count"], states[0]["revision"] or 0
+
+
+async def shift_grid(team, month, year, unique_ids=None, since=None, page=None, page_size=None):
+    """
+    The team's grid rows for one month, named from the roster, which is read
+    concurrently. `unique_ids` and `since` (rows with a newer revision)
+    narrow the rows; `page_size` pages through them by unique_id.
+    """
+    query = {'team': team, 'month': int(month), 'year': int(year)}
+    if unique_ids is not None:
+        query['unique_id'] = {"$in": list(unique_ids)}
+    if since is not None:
+        query['revision'] = {"$gt": since}
+
+    cursor = adb.database.shifts.find(query, {'_id': 0, 'unique_id': 1, 'shifts': 1, 'revision': 1, **CODE_FIELDS})
+    if page_size:
+        cursor = cursor.sort('unique_id', 1).skip((page - 1) * page_size).limit(page_size)
+
+    roster, rows = await asyncio.gather(fetch_roster(team), cursor.to_list(None))
+    for row in map(decode_document, rows):
+        row['name'] = roster.get(row.get('unique_id'), 'UNKNOWN') if row.get('unique_id') else 'UNKNOWN'
+    return rows
+
+
+async def shift_history(team, unique_id, year):
+    """One employee's shifts for every generated month of `year`, with their name."""
+    roster, history = await asyncio.gather(
+        fetch_roster(team),
+        adb.database.shifts.find({'unique_id': unique_id, 'year': int(year)},
+                                 {'_id': 0, 'shifts': 1, 'month': 1, 'year': 1, **CODE_FIELDS}).to_list(None),
+    )
+    return {'name': roster.get(unique_id, 'UNKNOWN'), 'history': [decode_document(shift) for shift in history]}
+
+
+async def fetch_teams():
+    return await adb.database.portal_manager.find_one({"_id": TEAMS_DOCUMENT_ID}, {"_id": 0, "teams": 1})
+
+
+async def dashboard(team, month, year, since=None, page=None, page_size=None, grid=None):
+    """
+    Grid, allowance table and team list for the shift page, loaded
+    concurrently. `grid` supplies rows already in hand (a month the request
+    just generated) instead of reading them.
+    """
+    reads = [fetch_rates(), fetch_teams()]
+    if grid is None:
+        reads.append(shift_grid(team, month, year, since=since, page=page, page_size=page_size))
+    rates, teams, *rows = await asyncio.gather(*reads)
+    if rows:
+        grid = rows[0]
+    return {'shifts': grid, 'allowance': rates.rows, 'teams': (teams or {}).get('teams', [])}
+
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from pymongo import ReturnDocument
+
+from app import db
+
+VERSION_ID = "data_version"
+
+
+def data_version():
+    """
+    Return the current data version shared by every worker. Read once per
+    request: every cache lookup made while serving it uses the same version.
+    """
+    if has_app_context() and "data_version" in g:
+        return g.data_version
+
+    doc = db.data_version.find_one({"_id": VERSION_ID})
+    version = doc.get("version", 0) if doc else 0
+    if has_app_context():
+        g.data_version = version
+    return version
+
+
+def bump_data_version():
+    """
+    Invalidate every cached result by moving the data version forward.
+    Must be called after the write it covers has completed.
+    """
+    doc = db.data_version.find_one_and_update({"_id": VERSION_ID}, {"$inc": {"version": 1}},
+                                              upsert=True, return_document=ReturnDocument.AFTER)
+    if has_app_context():
+        g.data_version = doc["version"]
+    return doc["version"]
+
+
+class ResultCache:
+    """
+    LRU cache for generated results with an entry and byte limit, backed by an
+    optional directory shared between workers.
+
+    Keys should include the data version so entries never need explicit
+    invalidation: once the version moves on, old entries simply stop being
+    requested and age out.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes or max_bytes * 4
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def init_app(self, app):
+        """Take the limits and disk directory from the REPORT_CACHE_* settings and start empty."""
+        config = app.config
+        with self.lock:
+            self.max_entries = config["REPORT_CACHE_MAX_ENTRIES"]
+            self.max_bytes = config["REPORT_CACHE_MAX_BYTES"]
+            self.disk_dir = config["REPORT_CACHE_DIR"]
+            self.max_disk_bytes = config["REPORT_CACHE_MAX_DISK_BYTES"] or self.max_bytes * 4
+            self.entries.clear()
+            self.size = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+        payload = self._read_disk(key)
+        with self.lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+
+        value = pickle.loads(payload)
+        self._store(key, value, len(payload))
+        return value
+
+    def set(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._store(key, value, len(payload))
+        self._write_disk(key, payload)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "evictions": self.evictions, "entries": len(self.entries), "bytes": self.size}
+
+    def _store(self, key, value, size):
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pickle")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as file:
+                payload = file.read()
+            os.utime(self._path(key))
+            return payload
+        except OSError:
+            return None
+
+    def _write_disk(self, key, payload):
+        if not self.disk_dir or len(payload) > self.max_disk_bytes:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(payload)
+        os.replace(tmp_path, self._path(key))
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+report_cache = ResultCache()
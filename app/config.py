@@ -0,0 +1,86 @@
+import os
+import tempfile
+from datetime import timedelta
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def load_config():
+    """
+    Build the Flask/Mongo settings from the environment (including any `.env`
+    file loaded by `load_dotenv`). Read at call time so each `create_app`
+    sees the current environment.
+    """
+    return {
+        "SECRET_KEY": os.getenv("SECRET_KEY", "uwenndknsksdieewo"),
+        "JWT_ACCESS_TOKEN_EXPIRES": timedelta(days=env_int("JWT_ACCESS_TOKEN_EXPIRES_DAYS", 7)),
+        # Off by default: `flask indexes ensure` is the deploy step.
+        "ENSURE_INDEXES": os.getenv("ENSURE_INDEXES", "0") == "1",
+        "MONGO_URI": os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+        "MONGO_DB": os.getenv("MONGO_DB", "hrportal"),
+        # Per worker process: size the pool for the worker's threads, not the node.
+        "MONGO_MAX_POOL_SIZE": env_int("MONGO_MAX_POOL_SIZE", 20),
+        "MONGO_MIN_POOL_SIZE": env_int("MONGO_MIN_POOL_SIZE", 0),
+        "MONGO_MAX_CONNECTING": env_int("MONGO_MAX_CONNECTING", 2),
+        "MONGO_MAX_IDLE_TIME_MS": env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "MONGO_CONNECT_TIMEOUT_MS": env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "MONGO_SOCKET_TIMEOUT_MS": env_int("MONGO_SOCKET_TIMEOUT_MS", 0) or None,
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0) or None,
+        "MONGO_READ_PREFERENCE": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+        "MONGO_COMPRESSORS": os.getenv("MONGO_COMPRESSORS", ""),
+        "COMPRESS_MIN_SIZE": env_int("COMPRESS_MIN_SIZE", 1024),
+        "COMPRESS_GZIP_LEVEL": env_int("COMPRESS_GZIP_LEVEL", 5),
+        "COMPRESS_BR_QUALITY": env_int("COMPRESS_BR_QUALITY", 4),
+        # "map" or "compact"; see app.shifts.codec.
+        "SHIFT_STORAGE": os.getenv("SHIFT_STORAGE", "map"),
+        # Seconds a worker trusts "no shift codes yet" before checking `shift_codes` again.
+        # Set SHIFT_STORAGE=compact before running `migrate-storage` so no write depends on it.
+        "SHIFT_CODES_RECHECK": env_int("SHIFT_CODES_RECHECK", 30),
+        # In-process caches; the TTLs only bound staleness for writes made by other workers.
+        "RATE_TABLE_TTL": env_int("RATE_TABLE_TTL", 60),
+        "ROSTER_CACHE_TTL": env_int("ROSTER_CACHE_TTL", 300),
+        "ROSTER_VERSION_TTL": env_int("ROSTER_VERSION_TTL", 5),
+        # Generated reports; REPORT_CACHE_DIR shares them between workers.
+        "REPORT_CACHE_MAX_ENTRIES": env_int("REPORT_CACHE_MAX_ENTRIES", 256),
+        "REPORT_CACHE_MAX_BYTES": env_int("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+        "REPORT_CACHE_DIR": os.getenv("REPORT_CACHE_DIR") or None,
+        "REPORT_CACHE_MAX_DISK_BYTES": env_int("REPORT_CACHE_MAX_DISK_BYTES", 0) or None,
+        # Background report jobs ("thread" or "process" pools).
+        "REPORT_SPOOL_DIR": os.getenv("REPORT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "hrportal_reports")),
+        "REPORT_JOB_TTL": env_int("REPORT_JOB_TTL", 3600),
+        "REPORT_JOB_WORKERS": env_int("REPORT_JOB_WORKERS", 2),
+        "REPORT_JOB_EXECUTOR": os.getenv("REPORT_JOB_EXECUTOR", "thread"),
+        # Company report team/year fan-out ("thread" or "process" pool).
+        "REPORT_WORKERS": env_int("REPORT_WORKERS", min(8, os.cpu_count() or 2)),
+        "REPORT_POOL": os.getenv("REPORT_POOL", "thread"),
+        "METRICS_ENABLED": os.getenv("METRICS_ENABLED", "1") != "0",
+        # Log requests slower than this with their per-command breakdown; 0 disables.
+        "METRICS_SLOW_MS": env_int("METRICS_SLOW_MS", 1000),
+        # Re-encodes every Mongo reply to measure it; only turn on while profiling.
+        "METRICS_REPLY_BYTES": os.getenv("METRICS_REPLY_BYTES", "0") == "1",
+    }
+
+
+def mongo_client_options(config):
+    """Translate the MONGO_* settings into MongoClient keyword arguments."""
+    options = {
+        "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+        "maxConnecting": config["MONGO_MAX_CONNECTING"],
+        "maxIdleTimeMS": config["MONGO_MAX_IDLE_TIME_MS"],
+        "connectTimeoutMS": config["MONGO_CONNECT_TIMEOUT_MS"],
+        "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+        "socketTimeoutMS": config["MONGO_SOCKET_TIMEOUT_MS"],
+        "waitQueueTimeoutMS": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "readPreference": config["MONGO_READ_PREFERENCE"],
+    }
+    if config["MONGO_COMPRESSORS"]:
+        options["compressors"] = config["MONGO_COMPRESSORS"]
+    if config["METRICS_ENABLED"]:
+        from app.metrics import QueryListener
+        options["event_listeners"] = [QueryListener(count_bytes=config["METRICS_REPLY_BYTES"])]
+    return options
@@ -0,0 +1,78 @@
+import os
+import threading
+
+from pymongo import MongoClient
+
+from app.config import load_config, mongo_client_options
+
+
+class MongoDatabase:
+    """
+    Stand-in for the `hrportal` pymongo Database that opens its MongoClient on
+    first use in each process.
+
+    A client created before a fork is never reused by the child: the pid is
+    checked on access and a fresh client is opened after fork, so prefork
+    servers get one pool per worker instead of sharing sockets. Collections
+    are reached the same way as on a pymongo Database (`db.shifts`,
+    `db["shifts"]`).
+    """
+
+    def __init__(self):
+        self._settings = None
+        self._client = None
+        self._pid = None
+        self._standin = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        with self._lock:
+            self._settings = (app.config["MONGO_URI"], app.config["MONGO_DB"], mongo_client_options(app.config))
+            self._client = None
+            self._standin = False
+
+    def use_client(self, client):
+        """Serve this process from an existing client, e.g. an in-memory stand-in for benchmarks."""
+        with self._lock:
+            self._client = client
+            self._pid = os.getpid()
+            self._standin = True
+
+    @property
+    def standin(self):
+        """The database of the client given to `use_client`, or None when serving from `settings`."""
+        return self.database if self._standin else None
+
+    @property
+    def settings(self):
+        """`(uri, database name, MongoClient options)`, from the environment if `init_app` was not called."""
+        if self._settings is None:
+            config = load_config()
+            self._settings = (config["MONGO_URI"], config["MONGO_DB"], mongo_client_options(config))
+        return self._settings
+
+    @property
+    def mongo_client(self):
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    uri, _, options = self.settings
+                    self._client = MongoClient(uri, **options)
+                    self._pid = pid
+        return self._client
+
+    @property
+    def database(self):
+        return self.mongo_client[self.settings[1]]
+
+    def command(self, *args, **kwargs):
+        return self.database.command(*args, **kwargs)
+
+    def __getitem__(self, name):
+        return self.database[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.database[name]
@@ -0,0 +1,128 @@
+import click
+from flask.cli import AppGroup
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from app import db
+
+INDEXES = [
+    # Serves get_shift_history (unique_id, year) and change_shift lookups;
+    # also blocks duplicate months.
+    ("shifts", [("unique_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)], {"unique": True}),
+    # Team-scoped grid load and month listing; revision lets the grid ETag
+    # (count + max revision) be computed from the index alone.
+    ("shifts", [("team", ASCENDING), ("year", ASCENDING), ("month", ASCENDING), ("revision", ASCENDING)], {}),
+    # Month pickers: get_months_created reads only this index.
+    ("shift_calendar", [("team", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)], {}),
+    ("shift_summaries", [("unique_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)], {}),
+    ("employees", [("team", ASCENDING)], {}),
+    ("employees", [("name", ASCENDING), ("team", ASCENDING)], {"unique": True}),
+    ("employees", [("unique_id", ASCENDING)], {"unique": True}),
+    ("allowance", [("shift", ASCENDING)], {"unique": True}),
+    ("allowance", [("unique_id", ASCENDING)], {"unique": True}),
+    ("users", [("username", ASCENDING)], {"unique": True}),
+    ("shift_codes", [("name", ASCENDING)], {"unique": True}),
+    ("shift_codes", [("code", ASCENDING)], {"unique": True}),
+]
+
+# IndexOptionsConflict, IndexKeySpecsConflict
+INDEX_CONFLICT_CODES = (85, 86)
+
+# Representative filters for the queries issued by the models. Values are
+# placeholders: only the shape of the filter decides which plan is chosen.
+QUERIES = [
+    ("Shifts.extract_shift", "shifts", {"team": "team", "month": 1, "year": 2024}),
+    ("Shifts.get_shift_history", "shifts", {"unique_id": "a", "year": 2024}),
+    ("change_shift", "shifts", {"unique_id": "a", "month": 1, "year": 2024}),
+    ("get_months_created", "shift_calendar", {"team": "team", "year": 2024}),
+    ("Report.unsummarized_months", "shifts", {"month": {"$in": [1, 2]}, "year": 2024, "unique_id": {"$in": ["a", "b"]}}),
+    ("Report.extract_data", "shift_summaries", {"month": {"$in": [1, 2]}, "year": 2024, "unique_id": {"$in": ["a", "b"]}}),
+    ("Shifts.__init__", "employees", {"team": "team"}),
+    ("add_new_employee", "employees", {"name": "name", "team": "team"}),
+    ("edit_employee", "employees", {"unique_id": "a"}),
+    ("adding_allowance", "allowance", {"shift": "night"}),
+    ("update_allowanceV2", "allowance", {"unique_id": "a"}),
+    ("get_user", "users", {"username": "user"}),
+]
+
+
+def ensure_indexes(rebuild=False):
+    """
+    Create the declared indexes. `create_index` is a no-op for indexes that
+    already exist.
+
+    An index that cannot be built (duplicate keys, or an existing index on the
+    same keys with other options) is reported, not fatal. Conflicting indexes
+    are only dropped and rebuilt when `rebuild` is set.
+
+    Returns:
+        list: One dict (`collection`, `keys`, `error`) per index that was not created.
+    """
+    failures = []
+    for collection, keys, options in INDEXES:
+        try:
+            try:
+                db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                if not rebuild or e.code not in INDEX_CONFLICT_CODES:
+                    raise
+                # Same keys declared with different options (e.g. now unique).
+                db[collection].drop_index(keys)
+                db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            failures.append({"collection": collection, "keys": keys, "error": str(e)})
+    return failures
+
+
+def plan_stages(plan):
+    """Yield every `stage` name found anywhere in an explain plan."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+def explain_queries():
+    """
+    Run `explain` on each model query.
+
+    Returns:
+        list: One dict per query with its winning plan stages and whether it scans the collection.
+    """
+    results = []
+    for name, collection, query in QUERIES:
+        explain = db.command({"explain": {"find": collection, "filter": query}, "verbosity": "queryPlanner"})
+        stages = list(plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        results.append({"query": name, "collection": collection, "stages": stages, "collscan": "COLLSCAN" in stages})
+    return results
+
+
+indexes_cli = AppGroup("indexes", help="Manage MongoDB indexes.")
+
+
+@indexes_cli.command("ensure")
+@click.option("--rebuild", is_flag=True, help="Drop and rebuild indexes declared with different options.")
+def ensure_indexes_command(rebuild):
+    """Create all declared indexes."""
+    failures = ensure_indexes(rebuild=rebuild)
+    for failure in failures:
+        click.echo(f"FAILED   {failure['collection']:16} {failure['keys']}: {failure['error']}", err=True)
+    click.echo(f"Ensured {len(INDEXES) - len(failures)} of {len(INDEXES)} indexes")
+    if failures:
+        raise SystemExit(1)
+
+
+@indexes_cli.command("explain")
+def explain_queries_command():
+    """Explain every model query and flag collection scans."""
+    results = explain_queries()
+    for result in results:
+        flag = "COLLSCAN" if result["collscan"] else "ok"
+        click.echo(f"{flag:8} {result['query']:28} {result['collection']:16} {' > '.join(result['stages'])}")
+
+    if any(result["collscan"] for result in results):
+        raise SystemExit(1)
@@ -0,0 +1,227 @@
+import threading
+import time
+from contextvars import ContextVar
+
+import bson
+from flask import Response, current_app, g, request
+from pymongo import monitoring
+
+# Upper bounds, in seconds, of the request latency histogram.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Cursor replies carry their documents in one of these batches.
+BATCH_FIELDS = ("firstBatch", "nextBatch")
+
+
+class RequestStats:
+    """Mongo work done on behalf of one HTTP request."""
+
+    __slots__ = ("queries", "mongo_micros", "documents", "reply_bytes", "pending", "breakdown")
+
+    def __init__(self):
+        self.queries = 0
+        self.mongo_micros = 0
+        self.documents = 0
+        self.reply_bytes = 0
+        self.pending = {}
+        # (command, collection) -> [count, micros, documents]
+        self.breakdown = {}
+
+
+current_stats = ContextVar("current_stats", default=None)
+
+
+def reply_documents(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        for field in BATCH_FIELDS:
+            if field in cursor:
+                return len(cursor[field])
+    if "value" in reply:  # findAndModify
+        return int(reply["value"] is not None)
+    return reply.get("n", 0)
+
+
+class QueryListener(monitoring.CommandListener):
+    """
+    Command listener that charges every Mongo command to the request it ran
+    for. Commands issued outside a request (CLI, background jobs) are ignored,
+    so the cost off the request path is one ContextVar lookup.
+    """
+
+    def __init__(self, count_bytes=False):
+        self.count_bytes = count_bytes
+
+    def started(self, event):
+        stats = current_stats.get()
+        if stats is not None:
+            command = event.command
+            collection = command.get(event.command_name)
+            if event.command_name == "getMore":
+                collection = command.get("collection")
+            stats.pending[event.request_id] = (event.command_name,
+                                               collection if isinstance(collection, str) else "")
+
+    def succeeded(self, event):
+        stats = current_stats.get()
+        if stats is not None:
+            self.record(stats, event, reply_documents(event.reply),
+                        len(bson.encode(event.reply)) if self.count_bytes else 0)
+
+    def failed(self, event):
+        stats = current_stats.get()
+        if stats is not None:
+            self.record(stats, event, 0, 0)
+
+    @staticmethod
+    def record(stats, event, documents, reply_bytes):
+        key = stats.pending.pop(event.request_id, (event.command_name, ""))
+        stats.queries += 1
+        stats.mongo_micros += event.duration_micros
+        stats.documents += documents
+        stats.reply_bytes += reply_bytes
+
+        entry = stats.breakdown.get(key)
+        if entry is None:
+            stats.breakdown[key] = [1, event.duration_micros, documents]
+        else:
+            entry[0] += 1
+            entry[1] += event.duration_micros
+            entry[2] += documents
+
+
+class RouteMetrics:
+    """
+    Per-route counters and latency histograms, aggregated in-process.
+
+    Each worker process keeps its own counters; scrape every worker (or
+    aggregate by instance label) when running under a prefork server.
+    """
+
+    FIELDS = ("requests", "seconds", "mongo_seconds", "queries", "documents", "bytes")
+
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, route, method, status, seconds, stats):
+        key = (route, method, status)
+        with self.lock:
+            entry = self.routes.get(key)
+            if entry is None:
+                entry = self.routes[key] = {field: 0 for field in self.FIELDS}
+                entry["buckets"] = [0] * len(LATENCY_BUCKETS)
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+            entry["mongo_seconds"] += stats.mongo_micros / 1e6
+            entry["queries"] += stats.queries
+            entry["documents"] += stats.documents
+            entry["bytes"] += stats.reply_bytes
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][index] += 1
+                    break
+
+    def render(self):
+        """Prometheus text exposition of the counters."""
+        with self.lock:
+            routes = [(key, dict(entry, buckets=list(entry["buckets"]))) for key, entry in self.routes.items()]
+
+        lines = [
+            "# HELP hrportal_request_duration_seconds Request latency per route.",
+            "# TYPE hrportal_request_duration_seconds histogram",
+        ]
+        for (route, method, status), entry in routes:
+            labels = f'route="{route}",method="{method}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, entry["buckets"]):
+                cumulative += count
+                lines.append(f'hrportal_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'hrportal_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry["requests"]}')
+            lines.append(f"hrportal_request_duration_seconds_sum{{{labels}}} {entry['seconds']:.6f}")
+            lines.append(f"hrportal_request_duration_seconds_count{{{labels}}} {entry['requests']}")
+
+        for field, name, help_text in (
+            ("mongo_seconds", "hrportal_mongo_seconds_total", "Time spent in Mongo commands per route."),
+            ("queries", "hrportal_mongo_queries_total", "Mongo commands issued per route."),
+            ("documents", "hrportal_mongo_documents_total", "Documents returned or written by Mongo per route."),
+            ("bytes", "hrportal_mongo_reply_bytes_total",
+             "BSON bytes of Mongo replies per route (0 unless METRICS_REPLY_BYTES=1)."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (route, method, status), entry in routes:
+                lines.append(f'{name}{{route="{route}",method="{method}",status="{status}"}} {entry[field]}')
+
+        return "\n".join(lines) + "\n"
+
+
+route_metrics = RouteMetrics()
+
+
+def start_request():
+    if request.endpoint == "metrics":
+        return
+    g.metrics_started = time.perf_counter()
+    g.metrics_stats = RequestStats()
+    g.metrics_token = current_stats.set(g.metrics_stats)
+
+
+def finish_request(exc=None):
+    stats = g.pop("metrics_stats", None)
+    if stats is None:
+        return
+    seconds = time.perf_counter() - g.pop("metrics_started")
+    try:
+        current_stats.reset(g.pop("metrics_token"))
+    except ValueError:
+        current_stats.set(None)  # Torn down in another context (e.g. after streaming).
+
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    status = 500 if exc is not None else g.pop("metrics_status", 0)
+    route_metrics.observe(route, request.method, status, seconds, stats)
+
+    slow_ms = current_app.config["METRICS_SLOW_MS"]
+    if slow_ms and seconds * 1000 >= slow_ms:
+        breakdown = ", ".join(
+            f"{command} {collection} x{count} {micros / 1000:.1f}ms {documents} docs"
+            for (command, collection), (count, micros, documents)
+            in sorted(stats.breakdown.items(), key=lambda item: -item[1][1])
+        )
+        current_app.logger.warning(
+            "Slow request %s %s: %.1fms, %d queries, %.1fms in Mongo, %d docs, %d bytes [%s]",
+            request.method, route, seconds * 1000, stats.queries, stats.mongo_micros / 1000,
+            stats.documents, stats.reply_bytes, breakdown)
+
+
+def record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def metrics_view():
+    return Response(route_metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    """Register the request hooks and the `/metrics` endpoint on `app`."""
+    app.before_request(start_request)
+    app.after_request(record_status)
+    app.teardown_request(finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+
+def bind_request_stats(coro):
+    """
+    Wrap `coro` so that Mongo commands it issues on another event loop are
+    charged to the calling request.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return coro
+
+    async def bound():
+        current_stats.set(stats)
+        return await coro
+
+    return bound()
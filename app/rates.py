@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import NamedTuple
+
+from app import db
+
+
+class RateSnapshot(NamedTuple):
+    version: int
+    rows: list
+    by_shift: dict
+    by_unique_id: dict
+
+
+class RateTable:
+    """
+    In-memory copy of the `allowance` collection indexed by shift name and
+    unique_id.
+
+    The allowance mutators call `refresh()` after they write; readers get an
+    immutable snapshot that is swapped in whole, so they never see a
+    half-built table and nothing is copied per read. The TTL only bounds
+    staleness for writes made by other worker processes.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.snapshot = RateSnapshot(0, [], {}, {})
+        self.expires = 0
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config["RATE_TABLE_TTL"]
+
+    def refresh(self):
+        return self.load([data for data in db.allowance.find({}, {'_id': 0})])
+
+    def load(self, rows):
+        """Index freshly read allowance rows and swap them in as the current snapshot."""
+        # Later rows win for a repeated shift name, like the original linear scan.
+        by_shift = {row.get('shift'): row for row in rows}
+        by_unique_id = {row.get('unique_id'): row for row in rows}
+
+        with self.lock:
+            self.snapshot = RateSnapshot(self.snapshot.version + 1, rows, by_shift, by_unique_id)
+            self.expires = time.monotonic() + self.ttl
+            return self.snapshot
+
+    def current(self):
+        return self.fresh() or self.refresh()
+
+    def fresh(self):
+        """Return the current snapshot, or None once the TTL has expired."""
+        if time.monotonic() >= self.expires:
+            return None
+        return self.snapshot
+
+    def rows(self):
+        return self.current().rows
+
+    def by_shift(self, shift):
+        return self.current().by_shift.get(shift)
+
+    def by_unique_id(self, unique_id):
+        return self.current().by_unique_id.get(unique_id)
+
+
+rate_table = RateTable()
@@ -0,0 +1,117 @@
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+from flask import current_app
+
+from app import db
+from app.rates import rate_table
+from app.report.export import write_parquet, write_xlsx, write_xlsx_sheets
+from app.report.utils import ALLOWANCE_COLUMNS, Report
+from app.roster import ROSTER_PROJECTION, roster_cache
+
+LAYOUTS = ("merged", "sheets")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Create the team/year fan-out pool on first use. It is separate from the
+    report job pool so a background job can fan out without waiting on its
+    own workers. Process pools use `spawn`, like the job pool. Sized from
+    REPORT_POOL and REPORT_WORKERS.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = current_app.config["REPORT_WORKERS"]
+            if current_app.config["REPORT_POOL"] == "process":
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-team")
+        return _pool
+
+
+def preload_rosters(teams):
+    """Fill the roster cache for every team with one employees query and return `{team: roster}`."""
+    version = roster_cache.current_version()
+    rosters = {team: roster_cache.cached(team, version) for team in teams}
+    missing = [team for team, roster in rosters.items() if roster is None]
+    if missing:
+        loaded = {team: {} for team in missing}
+        for data in db.employees.find({"team": {"$in": missing}}, {**ROSTER_PROJECTION, "team": 1}):
+            loaded[data["team"]][data.get("unique_id")] = data.get("name")
+        for team, roster in loaded.items():
+            rosters[team] = roster_cache.store(team, roster, version)
+    return rosters
+
+
+def team_year_frame(team, year, months, roster, rates):
+    """Pool task: one team's report for one year, prefixed with `team` and `year` columns."""
+    report = Report(months, year, team, roster=roster, rates=rates)
+    report.extract_data()
+    frame = report.build_frame()
+    frame.insert(0, "year", year)
+    frame.insert(0, "team", team)
+    return frame
+
+
+def build_company_frames(teams, years, months):
+    """
+    Build every (team, year) report concurrently.
+
+    Rosters and allowance rates are loaded once up front and handed to each
+    task, so workers only run their team's aggregation.
+
+    Returns:
+        list: `(team, year, frame)` in `teams` x `years` order.
+    """
+    rosters = preload_rosters(teams)
+    rates = rate_table.current().by_shift
+    pool = get_pool()
+
+    futures = [(team, year, pool.submit(team_year_frame, team, year, months, rosters[team], rates))
+               for team in teams for year in years]
+    return [(team, year, future.result()) for team, year, future in futures]
+
+
+def company_report(teams, years, months, fmt="csv", layout="merged"):
+    """
+    Build the multi-team, multi-year allowance report.
+
+    Args:
+        teams (list): Teams to include (at least one).
+        years (list): Years to include (at least one); every year covers the same `months`.
+        months (list): Month numbers.
+        fmt (str): One of `EXPORT_FORMATS`.
+        layout (str): `merged` for one table with `team`/`year` columns, or
+            `sheets` for one XLSX worksheet per team.
+
+    Returns:
+        io.BytesIO: The generated file, rewound.
+    """
+    frames = build_company_frames(teams, years, months)
+    header = list(frames[0][2].columns)
+
+    if layout == "sheets":
+        by_team = {}
+        for team, _, frame in frames:
+            by_team.setdefault(team, []).append(frame)
+        return write_xlsx_sheets([(team, header, pd.concat(parts).itertuples(index=False, name=None))
+                                  for team, parts in by_team.items()])
+
+    merged = pd.concat([frame for _, _, frame in frames], ignore_index=True)
+    if fmt == "parquet":
+        return write_parquet(header, {name: merged[name].to_numpy() for name in header},
+                             float_columns=ALLOWANCE_COLUMNS)
+    if fmt == "xlsx":
+        return write_xlsx(header, merged.itertuples(index=False, name=None))
+
+    buffer = io.BytesIO()
+    merged.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return buffer
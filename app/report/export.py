@@ -0,0 +1,99 @@
+import io
+import re
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the deployment
+    pa = pq = None
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - depends on the deployment
+    xlsxwriter = None
+
+# format -> (mimetype, download name)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "data.csv"),
+    "parquet": ("application/vnd.apache.parquet", "data.parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "data.xlsx"),
+}
+
+PARQUET_COMPRESSION = "zstd"
+
+
+def format_available(fmt):
+    """Whether the writer library for `fmt` is installed."""
+    if fmt == "parquet":
+        return pq is not None
+    if fmt == "xlsx":
+        return xlsxwriter is not None
+    return fmt in EXPORT_FORMATS
+
+
+def write_parquet(header, columns, float_columns=()):
+    """
+    Write the report columns as a Parquet file.
+
+    The column arrays (numpy or lists) are handed to Arrow as-is, so no
+    per-row Python objects are built; counts stay int64 and amounts are
+    numbers instead of text.
+
+    Args:
+        header (list): Column names in report order.
+        columns (dict): Column name -> array of values.
+        float_columns (iterable): Columns always written as float64, so the
+            schema does not depend on whether every amount was whole.
+
+    Returns:
+        io.BytesIO: The Parquet file, rewound.
+    """
+    float_columns = set(float_columns)
+    table = pa.table({name: pa.array(columns[name], type=pa.float64() if name in float_columns else None)
+                      for name in header})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=PARQUET_COMPRESSION)
+    buffer.seek(0)
+    return buffer
+
+
+def write_xlsx(header, rows, sheet_name="Report"):
+    """
+    Write report rows to an XLSX workbook with xlsxwriter's constant-memory
+    mode, which flushes each row to disk as soon as the next one starts, so
+    only one row is held at a time regardless of the report size.
+
+    Args:
+        header (list): Column names in report order.
+        rows (iterable): Rows in `header` order, e.g. `Report.iter_rows()`.
+        sheet_name (str): Worksheet name.
+
+    Returns:
+        io.BytesIO: The XLSX file, rewound.
+    """
+    return write_xlsx_sheets([(sheet_name, header, rows)])
+
+
+def write_xlsx_sheets(sheets):
+    """Like `write_xlsx`, with one worksheet per `(sheet_name, header, rows)`."""
+    buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {"constant_memory": True, "in_memory": False})
+    bold = workbook.add_format({"bold": True})
+
+    used = set()
+    for sheet_name, header, rows in sheets:
+        base = name = re.sub(r"[\[\]:*?/\\]", "_", sheet_name)[:31] or "Report"
+        suffix = 1
+        while name.lower() in used:  # Sheet names are case-insensitive and truncated to 31 chars.
+            suffix += 1
+            name = f"{base[:31 - len(str(suffix)) - 1]}~{suffix}"
+        used.add(name.lower())
+
+        worksheet = workbook.add_worksheet(name)
+        worksheet.write_row(0, 0, header, bold)
+        for index, row in enumerate(rows, start=1):
+            worksheet.write_row(index, 0, row)
+
+    workbook.close()
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Create the job pool on first use, so it is created inside each worker
+    process rather than inherited across a fork. Process pools use the
+    `spawn` start method so children open their own Mongo connections.
+    Sized from REPORT_JOB_EXECUTOR and REPORT_JOB_WORKERS.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config["REPORT_JOB_WORKERS"]
+            if current_app.config["REPORT_JOB_EXECUTOR"] == "process":
+                _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-job")
+        return _executor
+
+
+def valid_job_id(job_id):
+    try:
+        return uuid.UUID(job_id).hex == job_id
+    except (TypeError, ValueError):
+        return False
+
+
+def app_spool_dir():
+    return current_app.config["REPORT_SPOOL_DIR"]
+
+
+def meta_path(job_id, spool_dir=None):
+    return os.path.join(spool_dir or app_spool_dir(), f"{job_id}.json")
+
+
+def artifact_path(job_id, spool_dir=None):
+    return os.path.join(spool_dir or app_spool_dir(), f"{job_id}.csv")
+
+
+def write_atomic(path, payload):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def update_job(job_id, spool_dir=None, **fields):
+    """Merge `fields` into the job's metadata file. Metadata lives on disk so any worker can serve status."""
+    path = meta_path(job_id, spool_dir)
+    meta = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            meta = json.load(file)
+    meta.update(fields)
+    write_atomic(path, json.dumps(meta).encode())
+    return meta
+
+
+def build_report(job_id, months, year, team, spool_dir):
+    """Job body: run `Report` and spool the CSV. Runs in a pool thread or process, outside the app context."""
+    from app.report.utils import Report
+
+    update_job(job_id, spool_dir, status="running", started=time.time())
+    try:
+        csv_buf = Report(months, year, team).run()
+        write_atomic(artifact_path(job_id, spool_dir), csv_buf.getvalue())
+        update_job(job_id, spool_dir, status="done", finished=time.time())
+    except Exception as e:
+        update_job(job_id, spool_dir, status="failed", finished=time.time(), error=str(e))
+
+
+def submit_job(months, year, team):
+    """
+    Queue a report build.
+
+    Returns:
+        str: Job id to poll with `job_status`.
+    """
+    spool_dir = app_spool_dir()
+    os.makedirs(spool_dir, exist_ok=True)
+    cleanup_expired()
+
+    job_id = uuid.uuid4().hex
+    update_job(job_id, spool_dir, status="queued", created=time.time(), months=months, year=year, team=team)
+    get_executor().submit(build_report, job_id, months, year, team, spool_dir)
+    return job_id
+
+
+def job_status(job_id):
+    if not valid_job_id(job_id) or not os.path.exists(meta_path(job_id)):
+        return None
+    with open(meta_path(job_id)) as file:
+        return {"job_id": job_id, **json.load(file)}
+
+
+def cleanup_expired(ttl=None):
+    """Remove spooled job metadata and artifacts older than `ttl` seconds (default REPORT_JOB_TTL)."""
+    spool_dir = app_spool_dir()
+    if not os.path.isdir(spool_dir):
+        return
+
+    cutoff = time.time() - (ttl if ttl is not None else current_app.config["REPORT_JOB_TTL"])
+    for entry in os.scandir(spool_dir):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
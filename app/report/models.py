@@ -1,6 +1,129 @@
+import threading
+
+from pymongo import DeleteOne, UpdateOne
+
 from app import db
+from app.cache import bump_data_version
+
+# `shift_calendar` holds one tiny document per (team, year, month) that has
+# generated shifts (`_id` is the same triple), so month pickers read a
+# handful of entries from the (team, year, month) index instead of scanning
+# `shifts`.
+#
+# Months generated before the calendar existed are only in `shifts`, so a
+# team's entries are trusted once the team has been backfilled from its
+# shifts documents; that is recorded on the `calendar_complete` document
+# (`all` after `rebuild_calendar`, otherwise per team in `teams`). Every
+# month generated afterwards is recorded as it is created.
+COMPLETE_ID = "calendar_complete"
+
+
+class CalendarStatus:
+    """Per-process memo of the `calendar_complete` marker. Completeness is never revoked, so it only grows."""
+
+    def __init__(self):
+        self.all = False
+        self.teams = set()
+        self.lock = threading.Lock()
+
+    def complete(self, team=None):
+        if self.all or (team is not None and team in self.teams):
+            return True
+        doc = db.data_version.find_one({"_id": COMPLETE_ID}) or {}
+        with self.lock:
+            self.all = bool(doc.get("all"))
+            self.teams.update(doc.get("teams", []))
+            return self.all or (team is not None and team in self.teams)
+
+    def mark(self, teams=None):
+        """Record `teams` (every team when None) as backfilled."""
+        if teams is None:
+            db.data_version.update_one({"_id": COMPLETE_ID}, {"$set": {"all": True}}, upsert=True)
+        else:
+            db.data_version.update_one({"_id": COMPLETE_ID}, {"$addToSet": {"teams": {"$each": list(teams)}}},
+                                       upsert=True)
+        with self.lock:
+            self.all = self.all or teams is None
+            self.teams.update(teams or [])
+
+
+calendar_status = CalendarStatus()
+
+
+def calendar_key(team, year, month):
+    return {"team": team, "year": int(year), "month": int(month)}
+
 
 def get_months_created(year, team):
-    unique_id = [data.get('unique_id', "") for data in db.employees.find({"team": team}, {'_id': 0})]
-    return db.shifts.distinct("month", {"year": int(year), "unique_id": {"$in": unique_id}})
+    if not calendar_status.complete(team):
+        # First read for this team since the calendar was deployed: backfill
+        # it from its shifts documents once.
+        refresh_team_calendar(team)
+    return [entry["month"] for entry in
+            db.shift_calendar.find({"team": team, "year": int(year)}, {"_id": 0, "month": 1}).sort("month", 1)]
+
+
+def record_month(team, year, month):
+    """Mark a team's month as generated."""
+    key = calendar_key(team, year, month)
+    db.shift_calendar.update_one({"_id": key}, {"$set": key}, upsert=True)
+
+
+def refresh_team_calendar(*teams):
+    """
+    Recompute the calendar entries of `teams` from their shifts documents,
+    e.g. after employees moved between them, and mark them complete.
+    """
+    teams = [team for team in set(teams) if team]
+    if not teams:
+        return
+
+    wanted = {(row["_id"]["team"], row["_id"]["year"], row["_id"]["month"]) for row in db.shifts.aggregate([
+        {"$match": {"team": {"$in": teams}}},
+        {"$group": {"_id": {"team": "$team", "year": "$year", "month": "$month"}}},
+    ])}
+    current = {(entry["team"], entry["year"], entry["month"])
+               for entry in db.shift_calendar.find({"team": {"$in": teams}}, {"_id": 0})}
+
+    requests = [UpdateOne({"_id": calendar_key(*key)}, {"$set": calendar_key(*key)}, upsert=True)
+                for key in wanted - current]
+    requests += [DeleteOne({"_id": calendar_key(*key)}) for key in current - wanted]
+    if requests:
+        db.shift_calendar.bulk_write(requests, ordered=False)
+    calendar_status.mark(teams)
+
+
+def rebuild_calendar():
+    """
+    Rebuild `shift_calendar` from every shifts document and mark every team
+    complete.
+
+    Returns:
+        int: Number of calendar entries.
+    """
+    db.shifts.aggregate([
+        {"$match": {"team": {"$exists": True}}},
+        {"$group": {"_id": {"team": "$team", "year": "$year", "month": "$month"}}},
+        {"$project": {"team": "$_id.team", "year": "$_id.year", "month": "$_id.month"}},
+        {"$out": "shift_calendar"},
+    ], allowDiskUse=True)
+    calendar_status.mark()
+    bump_data_version()
+    return db.shift_calendar.count_documents({})
+
+
+def list_calendar(year=None):
+    """
+    Every generated month across all teams, in one query.
+
+    Returns:
+        dict: `{team: {year: [months]}}`, with years as strings as they appear in JSON.
+    """
+    if not calendar_status.complete():
+        rebuild_calendar()
 
+    query = {"year": int(year)} if year is not None else {}
+    calendar = {}
+    for entry in db.shift_calendar.find(query, {"_id": 0}).sort([("team", 1), ("year", 1), ("month", 1)]):
+        calendar.setdefault(entry["team"], {}).setdefault(str(entry["year"]), []).append(entry["month"])
+    return calendar
@@ -1,10 +1,21 @@
 from __future__ import annotations
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
+import io
+import click
 from app import db
-from app.report.models import get_months_created
+from app.serialization import compress_response
+from app.cache import data_version, report_cache
+from app.report.company import LAYOUTS, company_report
+from app.report.export import EXPORT_FORMATS, format_available
+from app.report.jobs import artifact_path, job_status, submit_job
+from app.report.models import get_months_created, list_calendar, rebuild_calendar
+from app.report.summaries import rebuild_summaries
 from app.report.utils import Report
+from app.roster import roster_cache
+from app.shifts.models import get_teams
 
 report = Blueprint('report', __name__)
+report.after_request(compress_response)
 
 def handle_error(message: str, status_code: int):
     """
@@ -21,6 +32,31 @@ def handle_error(message: str, status_code: int):
     response.status_code = status_code
     return response
 
+def parse_report_request(data: dict):
+    """
+    Validate the months, year and team of a report request.
+
+    Args:
+        data (dict): Request JSON body.
+
+    Returns:
+        tuple: (months, year, team, error) where error is an error response or None.
+    """
+    months = data.get("months", [1])
+    year = data.get("year", 2024)
+    team = data.get("team", "")
+
+    if not isinstance(months, list) or not all(isinstance(m, int) for m in months):
+        return None, None, None, handle_error("Invalid input: 'months' must be a list of integers", 400)
+
+    if not isinstance(year, int):
+        return None, None, None, handle_error("Invalid input: 'year' must be an integer", 400)
+
+    if not team:
+        return None, None, None, handle_error("Invalid input: 'team' field is required", 400)
+
+    return sorted(months), year, team, None
+
 @report.route('/get_months/<year>', methods=['POST'])
 def get_months(year: str):
     """
@@ -41,44 +77,220 @@ def get_months(year: str):
         if not team:
             return handle_error("Invalid input: 'team' field is required", 400)
 
-        months = get_months_created(year, team)
+        key = report_cache.make_key("months", team, year, data_version())
+        months = report_cache.get(key)
+        if months is None:
+            months = get_months_created(year, team)
+            report_cache.set(key, months)
+
         return jsonify({"months": months, "year": year})
     except Exception as e:
         return handle_error(str(e), 500)
 
+@report.route('/calendar', methods=['GET'])
+def get_calendar():
+    """
+    List the generated months of every team, optionally for one `year`
+    query parameter.
+
+    Returns:
+        Response: JSON response with `{team: {year: [months]}}`, or an error message.
+    """
+    try:
+        year = request.args.get("year")
+        if year is not None and not year.isdigit():
+            return handle_error("Invalid input: 'year' must be an integer", 400)
+
+        key = report_cache.make_key("calendar", year, data_version())
+        calendar = report_cache.get(key)
+        if calendar is None:
+            calendar = list_calendar(year)
+            report_cache.set(key, calendar)
+
+        return jsonify({"calendar": calendar})
+    except Exception as e:
+        return handle_error(str(e), 500)
+
 @report.route('/generate_csv', methods=['POST'])
 def generate_csv():
     """
-    Generate a CSV report for specified months, year, and team.
+    Generate a report file for specified months, year, and team.
+
+    The JSON body's `format` selects the file type: `csv` (default),
+    `parquet` or `xlsx`. When it sets `"stream": true` a CSV is sent as a
+    chunked response, one row per employee, instead of being buffered in memory.
 
     Args:
         None (data passed in JSON format via POST request).
 
     Returns:
-        Response: File download response for the generated CSV, or an error message.
+        Response: File download response for the generated report, or an error message.
     """
     try:
         data = request.json
         if not data:
             return handle_error("Invalid input: No JSON data found", 400)
 
-        months = data.get("months", [1])
-        year = data.get("year", 2024)
-        team = data.get("team", "")
+        months, year, team, error = parse_report_request(data)
+        if error:
+            return error
+
+        fmt = data.get("format", "csv")
+        if fmt not in EXPORT_FORMATS:
+            return handle_error(f"Invalid input: 'format' must be one of {', '.join(EXPORT_FORMATS)}", 400)
+        if not format_available(fmt):
+            return handle_error(f"The {fmt} export is not available on this server", 501)
+        mimetype, filename = EXPORT_FORMATS[fmt]
+
+        stream = data.get("stream", False)
+        key = report_cache.make_key(fmt, team, year, tuple(months), data_version())
+        file_bytes = report_cache.get(key)
+
+        if file_bytes is None:
+            report = Report(months, year, team)
+
+            if stream and fmt == "csv":
+                return Response(stream_with_context(report.stream_csv()), mimetype=mimetype,
+                                headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+            file_bytes = report.export(fmt).getvalue()
+            report_cache.set(key, file_bytes)
+
+        return send_file(io.BytesIO(file_bytes), mimetype=mimetype, as_attachment=True, download_name=filename)
+    except Exception as e:
+        return handle_error(str(e), 500)
+
+@report.route('/generate_company', methods=['POST'])
+def generate_company():
+    """
+    Generate one report across several teams and years.
+
+    JSON fields: `teams` (defaults to every team), `years` (list of
+    integers), `months` (defaults to all twelve), `format` as for
+    `generate_csv`, and `layout`: `merged` (one table with `team` and `year`
+    columns, the default) or `sheets` (XLSX only, one worksheet per team).
+
+    Returns:
+        Response: File download response for the generated report, or an error message.
+    """
+    try:
+        data = request.json
+        if not data:
+            return handle_error("Invalid input: No JSON data found", 400)
+
+        teams = data.get("teams") or (get_teams() or {}).get("teams", [])
+        years = data.get("years")
+        months = data.get("months", list(range(1, 13)))
+        fmt = data.get("format", "csv")
+        layout = data.get("layout", "merged")
 
-        if not isinstance(months, list) or not all(isinstance(m, int) for m in months):
+        if not isinstance(teams, list) or not teams or not all(isinstance(t, str) and t for t in teams):
+            return handle_error("Invalid input: 'teams' must be a list of team names", 400)
+        if not isinstance(years, list) or not years or not all(isinstance(y, int) for y in years):
+            return handle_error("Invalid input: 'years' must be a list of integers", 400)
+        if not isinstance(months, list) or not months or not all(isinstance(m, int) for m in months):
             return handle_error("Invalid input: 'months' must be a list of integers", 400)
+        if fmt not in EXPORT_FORMATS:
+            return handle_error(f"Invalid input: 'format' must be one of {', '.join(EXPORT_FORMATS)}", 400)
+        if layout not in LAYOUTS:
+            return handle_error(f"Invalid input: 'layout' must be one of {', '.join(LAYOUTS)}", 400)
+        if layout == "sheets":
+            fmt = "xlsx"
+        if not format_available(fmt):
+            return handle_error(f"The {fmt} export is not available on this server", 501)
 
-        if not isinstance(year, int):
-            return handle_error("Invalid input: 'year' must be an integer", 400)
+        teams, years, months = list(dict.fromkeys(teams)), sorted(set(years)), sorted(set(months))
+        mimetype, filename = EXPORT_FORMATS[fmt]
+        key = report_cache.make_key("company", tuple(teams), tuple(years), tuple(months), fmt, layout, data_version())
+        file_bytes = report_cache.get(key)
+        if file_bytes is None:
+            file_bytes = company_report(teams, years, months, fmt, layout).getvalue()
+            report_cache.set(key, file_bytes)
 
-        if not team:
-            return handle_error("Invalid input: 'team' field is required", 400)
+        return send_file(io.BytesIO(file_bytes), mimetype=mimetype, as_attachment=True, download_name=filename)
+    except Exception as e:
+        return handle_error(str(e), 500)
 
-        months.sort()
-        report = Report(months, year, team)
-        csv_buf = report.run()
+@report.route('/jobs', methods=['POST'])
+def submit_report_job():
+    """
+    Queue a CSV report build in the background job pool.
+
+    Args:
+        None (months, year and team passed in JSON format via POST request).
 
-        return send_file(csv_buf, mimetype='text/csv', as_attachment=True, download_name='data.csv')
+    Returns:
+        Response: JSON response with the job id (202), or an error message.
+    """
+    try:
+        data = request.json
+        if not data:
+            return handle_error("Invalid input: No JSON data found", 400)
+
+        months, year, team, error = parse_report_request(data)
+        if error:
+            return error
+
+        job_id = submit_job(months, year, team)
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
     except Exception as e:
         return handle_error(str(e), 500)
+
+@report.route('/jobs/<job_id>', methods=['GET'])
+def report_job_status(job_id: str):
+    """
+    Fetch the status of a background report job.
+
+    Args:
+        job_id (str): Id returned when the job was submitted.
+
+    Returns:
+        Response: JSON response with the job status, or an error message.
+    """
+    status = job_status(job_id)
+    if status is None:
+        return handle_error("Job not found", 404)
+    return jsonify(status)
+
+@report.route('/jobs/<job_id>/download', methods=['GET'])
+def download_report_job(job_id: str):
+    """
+    Download the CSV produced by a finished background report job.
+
+    Args:
+        job_id (str): Id returned when the job was submitted.
+
+    Returns:
+        Response: File download response for the generated CSV, or an error message.
+    """
+    status = job_status(job_id)
+    if status is None:
+        return handle_error("Job not found", 404)
+    if status.get("status") != "done":
+        return handle_error(f"Job is {status.get('status')}", 409)
+
+    return send_file(artifact_path(job_id), mimetype='text/csv', as_attachment=True, download_name='data.csv')
+
+@report.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """
+    Report hit/miss counters for the generated report cache and the team
+    roster cache (including how many employee reads it saved).
+
+    Returns:
+        Response: JSON response with the cache counters.
+    """
+    return jsonify({"report": report_cache.stats(), "roster": roster_cache.stats()})
+
+@report.cli.command('rebuild-summaries')
+@click.option('--year', type=int, default=None, help='Only rebuild summaries for this year.')
+def rebuild_summaries_command(year: int | None):
+    """Backfill the shift_summaries collection from raw shifts documents."""
+    count = rebuild_summaries(year)
+    click.echo(f"Rebuilt {count} shift summaries")
+
+@report.cli.command('rebuild-calendar')
+def rebuild_calendar_command():
+    """Rebuild the shift_calendar month index from shifts documents."""
+    count = rebuild_calendar()
+    click.echo(f"Rebuilt {count} calendar entries")
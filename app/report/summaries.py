@@ -0,0 +1,192 @@
+from pymongo.errors import PyMongoError
+
+from app import db
+from app.cache import bump_data_version
+from app.shifts.codec import shift_codes
+
+SKIPPED_SHIFTS = ["general", "planned", "restricted", "holiday"]
+# Overwork days are reported under this shift; they are paid at the
+# `overwork_allowance` of the shift the day is actually on.
+OVERWORK_SHIFT = "holiday"
+MAX_MONTH_DAYS = 31
+
+
+def compact_days_expression():
+    """`$objectToArray`-shaped day entries built from a compact document's codes and overwork bitmask."""
+    return {"$map": {
+        "input": {"$range": [0, {"$size": "$codes"}]},
+        "as": "i",
+        "in": {
+            "k": {"$concat": ["day_", {"$toString": {"$add": ["$$i", 1]}}]},
+            "v": {
+                "code": {"$arrayElemAt": ["$codes", "$$i"]},
+                "overwork": {"$eq": [{"$mod": [
+                    {"$floor": {"$divide": [{"$ifNull": ["$overwork_mask", 0]}, {"$pow": [2, "$$i"]}]}}, 2]}, 1]},
+            },
+        },
+    }}
+
+
+def shift_totals_pipeline(match):
+    """
+    Build the aggregation pipeline that folds raw `shifts` documents into
+    per employee/month/shift day counts and allowance amounts.
+
+    Both storage formats are read: day maps (`shifts`) and compact documents
+    (`codes` + `overwork_mask`, see `app.shifts.codec`), which are unpacked
+    into the same (day, code, overwork) entries.
+
+    Days are grouped per (shift, overwork) before joining `allowance`, so the
+    lookup runs once per distinct shift instead of once per day. Skipped
+    shifts and shifts without an allowance rate come back with a null shift
+    name so employees with no paid days still get an (empty) month entry.
+
+    Args:
+        match (dict): `$match` filter applied to the `shifts` collection.
+
+    Returns:
+        list: Aggregation pipeline stages.
+    """
+    day_number = {"$toInt": {"$arrayElemAt": [{"$split": ["$days.k", "_"]}, 1]}}
+    compact_days = compact_days_expression()
+    overwork = "$_id.overwork"
+
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "unique_id": 1, "year": 1, "month": 1, "days": {"$cond": [
+            {"$isArray": "$codes"}, compact_days, {"$objectToArray": "$shifts"}]}}},
+        {"$unwind": "$days"},
+        {"$group": {
+            "_id": {"unique_id": "$unique_id", "year": "$year", "month": "$month",
+                    "shift": "$days.v.shift", "code": "$days.v.code", "overwork": "$days.v.overwork"},
+            "count": {"$sum": 1},
+            "first_day": {"$min": day_number},
+        }},
+        # Compact documents are grouped by code; names are resolved once per group.
+        {"$lookup": {"from": "shift_codes", "localField": "_id.code", "foreignField": "code", "as": "code_name"}},
+        {"$addFields": {"shift": {"$ifNull": ["$_id.shift", {"$arrayElemAt": ["$code_name.name", 0]}]}}},
+        {"$lookup": {"from": "allowance", "localField": "shift", "foreignField": "shift", "as": "rate"}},
+        {"$addFields": {"rate": {"$arrayElemAt": ["$rate", -1]}}},
+        {"$group": {
+            "_id": {
+                "unique_id": "$_id.unique_id",
+                "year": "$_id.year",
+                "month": "$_id.month",
+                "shift": {"$cond": [
+                    {"$or": [{"$in": ["$shift", SKIPPED_SHIFTS]}, {"$eq": [{"$type": "$rate"}, "missing"]}]},
+                    None,
+                    {"$cond": [overwork, OVERWORK_SHIFT, "$shift"]},
+                ]},
+            },
+            "total": {"$sum": "$count"},
+            "allowance": {"$sum": {"$multiply": [
+                "$count", {"$cond": [overwork, "$rate.overwork_allowance", "$rate.allowance"]}]}},
+            "first_day": {"$min": "$first_day"},
+        }},
+        {"$sort": {"_id.unique_id": 1, "_id.year": 1, "_id.month": 1, "first_day": 1}},
+    ]
+
+
+def summary_pipeline(match):
+    """
+    Extend `shift_totals_pipeline` to fold the per-shift rows into one
+    document per (unique_id, year, month) and merge it into `shift_summaries`.
+
+    Summary documents look like::
+
+        {"_id": {"unique_id": ..., "year": ..., "month": ...},
+         "unique_id": ..., "year": ..., "month": ...,
+         "shifts": [{"shift": "night", "total": 3, "allowance": 450}, ...]}
+
+    with `shifts` ordered by the first day each shift appears in the month.
+    """
+    return shift_totals_pipeline(match) + [
+        {"$group": {
+            "_id": {"unique_id": "$_id.unique_id", "year": "$_id.year", "month": "$_id.month"},
+            "shifts": {"$push": {"shift": "$_id.shift", "total": "$total", "allowance": "$allowance"}},
+        }},
+        {"$project": {
+            "unique_id": "$_id.unique_id",
+            "year": "$_id.year",
+            "month": "$_id.month",
+            "shifts": {"$filter": {"input": "$shifts", "cond": {"$ne": ["$$this.shift", None]}}},
+        }},
+        {"$merge": {"into": "shift_summaries", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def refresh_summaries(match=None):
+    """
+    Recompute the `shift_summaries` documents for the `shifts` documents
+    selected by `match` (all of them when omitted). Runs entirely server-side.
+    """
+    list(db.shifts.aggregate(summary_pipeline(match or {}), allowDiskUse=True))
+
+
+def shift_names_match(names):
+    """
+    `shifts` filter for the documents whose summaries depend on the rates of
+    the given shift names: any day on one of them, in either storage format.
+    """
+    names = sorted(set(names))
+    clauses = [{f"shifts.day_{day}.shift": {"$in": names}} for day in range(1, MAX_MONTH_DAYS + 1)]
+    codes = [code for code in map(shift_codes.find, names) if code is not None]
+    if codes:
+        clauses.append({"codes": {"$in": codes}})
+    return {"$or": clauses}
+
+
+def refresh_shift_summaries(names):
+    """Recompute the summaries affected by a rate change on the given shift names."""
+    names = [name for name in names if name]
+    if names:
+        refresh_summaries(shift_names_match(names))
+
+
+def refresh_month_summaries(month, year, unique_ids):
+    """
+    Recompute the summaries of the given employees for one month. If that
+    fails, their summaries are deleted rather than left stale: reports
+    compute months without a summary from the raw `shifts` documents.
+    """
+    if not unique_ids:
+        return
+    match = {"month": int(month), "year": int(year), "unique_id": {"$in": list(unique_ids)}}
+    try:
+        refresh_summaries(match)
+    except PyMongoError:
+        db.shift_summaries.delete_many(match)
+        raise
+
+
+def rebuild_summaries(year=None):
+    """
+    Backfill `shift_summaries`, optionally for a single year.
+
+    Every summary is recomputed in place first, so reports keep reading the
+    previous figures until theirs is replaced; summaries whose `shifts`
+    document no longer exists are deleted afterwards.
+
+    Returns:
+        int: Number of summary documents after the rebuild.
+    """
+    match = {"year": int(year)} if year is not None else {}
+    refresh_summaries(match)
+
+    orphans = db.shift_summaries.aggregate([
+        {"$match": match},
+        {"$lookup": {"from": "shifts", "as": "source",
+                     "let": {"unique_id": "$unique_id", "year": "$year", "month": "$month"},
+                     "pipeline": [{"$match": {"$expr": {"$and": [{"$eq": ["$unique_id", "$$unique_id"]},
+                                                                 {"$eq": ["$year", "$$year"]},
+                                                                 {"$eq": ["$month", "$$month"]}]}}},
+                                  {"$limit": 1}, {"$project": {"_id": 1}}]}},
+        {"$match": {"source": []}},
+        {"$project": {"_id": 1}},
+    ], allowDiskUse=True)
+    orphan_ids = [orphan["_id"] for orphan in orphans]
+    if orphan_ids:
+        db.shift_summaries.delete_many({"_id": {"$in": orphan_ids}})
+
+    bump_data_version()
+    return db.shift_summaries.count_documents(match)
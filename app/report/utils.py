@@ -1,40 +1,90 @@
+import numpy as np
 import pandas as pd
 from app import db
+from app.report.export import write_parquet, write_xlsx
+from app.report.summaries import shift_totals_pipeline
+from app.rates import rate_table
+from app.roster import get_roster
+from app.shifts.codec import decode_document
 import io
+import csv
 import calendar
+from itertools import groupby
+
+SHIFT_LIST = ["night", "afternoon", "holiday"]
+ALLOWANCE_COLUMNS = [f"Total {shift} shift Allowance" for shift in SHIFT_LIST]
+
+
+def pivot_values(long_form, values, keys, columns):
+    """Pivot one value column of the long-form report to employee rows x (shift, month) columns."""
+    if long_form.empty:
+        return pd.DataFrame(0, index=keys, columns=columns)
+
+    pivoted = long_form.pivot(index="key", columns=["shift", "month"], values=values)
+    return pivoted.reindex(index=keys, columns=columns, fill_value=0).fillna(0)
+
+
+def allowance_sums(data, month_names):
+    """
+    One employee's allowance total of each shift, summed in Python in month
+    order so every cell keeps the type and formatting of the stored amounts
+    (`300` stays `300` next to `150.5`), as the row-by-row builder wrote them.
+    """
+    sums = {}
+    for month, shift_data in data.items():
+        if month not in month_names:
+            continue
+        for shift, value in shift_data.items():
+            if shift in SHIFT_LIST:
+                sums[shift] = sums[shift] + value["allowance"] if shift in sums else value["allowance"]
+    return [sums.get(shift, 0) for shift in SHIFT_LIST]
+
+
+def allowance_totals(report_data, month_names):
+    """`allowance_sums` of every employee, as one object array per shift."""
+    rows = [allowance_sums(data, month_names) for data in report_data.values()]
+    return {shift: np.array([row[index] for row in rows], dtype=object) for index, shift in enumerate(SHIFT_LIST)}
+
 
 class Report:
-    def __init__(self, months, year, team):
-        self.employee = { data.get('unique_id'): data.get('name') for data in db.employees.find({"team": team}, {'_id': 0}) }
-        self.allowance = [data for data in db.allowance.find({}, {'_id': 0})]
+    def __init__(self, months, year, team, engine="summary", roster=None, rates=None):
+        # `roster`/`rates` let callers building many reports share one preload.
+        self.employee = roster if roster is not None else get_roster(team)
+        self.rates = rates if rates is not None else rate_table.current().by_shift
         self.unique_id = list(self.employee.keys())
         self.team = team
         self.months = months
         self.year = year
+        self.engine = engine
         self.report_data = {}
-    
+
     def extract_data(self):
+        if self.engine in ("summary", "aggregate"):
+            return self.extract_data_aggregate()
+
         for month in self.months:
             month_data = db.shifts.find({"month": month, "year": self.year,
                                           "unique_id": {"$in": self.unique_id}}, {"_id": 0})
-            for data in month_data:
+            for data in map(decode_document, month_data):
                 shift_dict = {}
                 # working_days = 0
                 for day, shift_info in data["shifts"].items():
                     if shift_info["shift"] in ["general", "planned", "restricted", "holiday"]:
                         continue
 
-                    for allowance in self.allowance:
-                        if allowance["shift"] == shift_info["shift"]:
-                            if shift_info["overwork"]:
-                                shift_name = "holiday"
-                                allowance_amount = allowance["overwork_allowance"]
-                            else:
-                                shift_name = shift_info["shift"]
-                                allowance_amount = allowance["allowance"]
-                            # working_days += 1
-
-                    if shift_info["shift"] not in shift_dict.keys():
+                    allowance = self.rates.get(shift_info["shift"])
+                    if allowance is None:
+                        continue
+
+                    if shift_info["overwork"]:
+                        shift_name = "holiday"
+                        allowance_amount = allowance["overwork_allowance"]
+                    else:
+                        shift_name = shift_info["shift"]
+                        allowance_amount = allowance["allowance"]
+                    # working_days += 1
+
+                    if shift_name not in shift_dict.keys():
                         shift_dict[shift_name] = {"total": 1, "allowance": allowance_amount}
                     else:
                         shift_dict[shift_name]["total"] += 1
@@ -42,53 +92,151 @@ class Report:
                 
                 # shift_dict["working_days"] = working_days
 
-                if self.employee[data["unique_id"]] not in self.report_data.keys():
-                    self.report_data[self.employee[data["unique_id"]]] = {calendar.month_name[month]: shift_dict}
+                if data["unique_id"] not in self.report_data.keys():
+                    self.report_data[data["unique_id"]] = {calendar.month_name[month]: shift_dict}
                 else:
-                    self.report_data[self.employee[data["unique_id"]]].update({calendar.month_name[month]: shift_dict})
-    
-    def convert_to_csv(self):
-        header = ["name"]
-        shift_list = ["night", "afternoon", "holiday"]
+                    self.report_data[data["unique_id"]].update({calendar.month_name[month]: shift_dict})
+
+        # Rows come out in unique_id order, like the cursor-driven engines.
+        self.report_data = dict(sorted(self.report_data.items()))
+
+    def extract_data_aggregate(self):
+        """
+        Fill `report_data` for every requested month with a single round-trip,
+        reading either the materialized `shift_summaries` or an aggregation
+        over raw `shifts`. Produces the same structure as the per-month scan,
+        in the order `iter_employee_months` yields employees.
+        """
+        for unique_id, months in self.iter_employee_months():
+            self.report_data.setdefault(unique_id, {}).update(self.month_data(months))
+
+    def month_data(self, months):
+        """Key one employee's `{month: shift_dict}` by month name, keeping only the report's months."""
+        return {calendar.month_name[month]: months[month] for month in self.months if month in months}
+
+    def iter_employee_months(self):
+        """
+        Yield `(unique_id, {month: shift_dict})` for each employee, in
+        unique_id order, as soon as the cursor has returned all of that
+        employee's rows.
+        """
+        match = {"month": {"$in": self.months}, "year": self.year, "unique_id": {"$in": self.unique_id}}
+
+        if self.engine != "summary":
+            yield from self.aggregate_employee_months(match)
+            return
+
+        pending = sorted(self.unsummarized_months(match).items())
+        rows = db.shift_summaries.find(match, {"_id": 0, "unique_id": 1, "month": 1, "shifts": 1}) \
+            .sort([("unique_id", 1), ("month", 1)])
+        for unique_id, summaries in groupby(rows, key=lambda row: row["unique_id"]):
+            months = {
+                summary["month"]: {item["shift"]: {"total": item["total"], "allowance": item["allowance"]}
+                                   for item in summary["shifts"]}
+                for summary in summaries
+            }
+            while pending and pending[0][0] < unique_id:
+                yield pending.pop(0)
+            if pending and pending[0][0] == unique_id:
+                months.update(pending.pop(0)[1])
+            yield unique_id, months
+        yield from pending
 
-        shift_columns = []
+    def unsummarized_months(self, match):
+        """
+        Months selected by `match` that have a shifts document but no summary
+        (not backfilled yet, or their refresh failed), computed from the raw
+        documents: `{unique_id: {month: shift_dict}}`. Both key reads are
+        covered by the (unique_id, year, month) indexes.
+        """
+        keys = {(row["unique_id"], row["month"])
+                for row in db.shifts.find(match, {"_id": 0, "unique_id": 1, "month": 1})}
+        keys -= {(row["unique_id"], row["month"])
+                 for row in db.shift_summaries.find(match, {"_id": 0, "unique_id": 1, "month": 1})}
+        if not keys:
+            return {}
 
-        for shift in shift_list:
+        missing = {"month": {"$in": sorted({month for _, month in keys})}, "year": self.year,
+                   "unique_id": {"$in": sorted({unique_id for unique_id, _ in keys})}}
+        fallback = {}
+        for unique_id, months in self.aggregate_employee_months(missing):
+            for month, shift_dict in months.items():
+                if (unique_id, month) in keys:
+                    fallback.setdefault(unique_id, {})[month] = shift_dict
+        return fallback
+
+    def aggregate_employee_months(self, match):
+        """`iter_employee_months` computed from the raw `shifts` documents selected by `match`."""
+        current, months = None, {}
+        for row in db.shifts.aggregate(shift_totals_pipeline(match), allowDiskUse=True):
+            key = row["_id"]
+            if key["unique_id"] != current:
+                if current is not None:
+                    yield current, months
+                current, months = key["unique_id"], {}
+
+            month_data = months.setdefault(key["month"], {})
+            if key["shift"] is not None:
+                month_data[key["shift"]] = {"total": row["total"], "allowance": row["allowance"]}
+
+        if current is not None:
+            yield current, months
+
+    def header(self):
+        header = ["name"]
+
+        for shift in SHIFT_LIST:
             for month in self.months:
                 header.append(f"{calendar.month_name[month]} ({shift})")
-            shift_columns.append(f"Total {shift} shift")
             header.append(f"Total {shift} shift")
-        
+
         header.append("Total working days")
+        header.extend(ALLOWANCE_COLUMNS)
+
+        return header
+
+    def build_columns(self):
+        """
+        Build the report table column by column: the per-employee month/shift
+        day counts are collected into one long-form frame, pivoted once, and
+        the count totals are computed with column-wise sums. Allowance totals
+        come from `allowance_totals`.
 
-        for shift in shift_list:
-            header.append(f"Total {shift} shift Allowance")
+        Returns:
+            dict: Header name -> numpy array, in `header()` order.
+        """
+        keys = list(self.report_data.keys())
+        month_names = [calendar.month_name[month] for month in self.months]
 
+        records = [(key, month, shift, value["total"], value["allowance"])
+                   for key, data in self.report_data.items()
+                   for month, shift_data in data.items()
+                   for shift, value in shift_data.items()
+                   if shift in SHIFT_LIST and month in month_names]
+        long_form = pd.DataFrame.from_records(records, columns=["key", "month", "shift", "total", "allowance"])
 
-        dataframe = pd.DataFrame(columns=header)
-        
-        for employee, data in self.report_data.items():
-            row_data = {"name": employee}
-            for month, shift_data in data.items():
-                for shift, value in shift_data.items():
+        columns = pd.MultiIndex.from_product([SHIFT_LIST, month_names], names=["shift", "month"])
+        totals = pivot_values(long_form, "total", keys, columns).astype("int64")
+        allowances = allowance_totals(self.report_data, set(month_names))
 
+        table = {"name": [self.employee[key] for key in keys]}
+        for shift in SHIFT_LIST:
+            for month in month_names:
+                table[f"{month} ({shift})"] = totals[(shift, month)].to_numpy()
+            table[f"Total {shift} shift"] = totals[shift].sum(axis=1).to_numpy()
 
-                    if f"{month} ({shift})" in header:
-                        row_data[f"{month} ({shift})"] = value["total"]
+        table["Total working days"] = totals.sum(axis=1).to_numpy()
 
-                        if f"Total {shift} shift" in row_data.keys():
-                            row_data[f"Total {shift} shift"] += value["total"]
-                        else:
-                            row_data[f"Total {shift} shift"] = value["total"]
-                        
-                        if f"Total {shift} shift Allowance" in row_data.keys():
-                            row_data[f"Total {shift} shift Allowance"] += value["allowance"]
-                        else:
-                            row_data[f"Total {shift} shift Allowance"] = value["allowance"]
-                    
-            dataframe = pd.concat([dataframe, pd.DataFrame([row_data])], ignore_index=True)
-            dataframe.fillna(0, inplace=True)
-        dataframe["Total working days"]= dataframe[shift_columns].sum(axis=1)
+        for shift in SHIFT_LIST:
+            table[f"Total {shift} shift Allowance"] = allowances[shift]
+
+        return table
+
+    def build_frame(self):
+        return pd.DataFrame(self.build_columns(), columns=self.header())
+
+    def convert_to_csv(self):
+        dataframe = self.build_frame()
 
         csv_buffer = io.BytesIO()
         dataframe.to_csv(csv_buffer, index=False)
@@ -96,6 +244,75 @@ class Report:
 
         return csv_buffer
 
+    def csv_row(self, name, data):
+        """
+        Build one report row, in `header()` order, from an employee's
+        `{month_name: shift_dict}` entry; the same values `build_columns`
+        produces for that employee.
+        """
+        month_names = [calendar.month_name[month] for month in self.months]
+        row = [name]
+        working_days = 0
+
+        for shift in SHIFT_LIST:
+            shift_total = 0
+            for month in month_names:
+                value = data.get(month, {}).get(shift)
+                count = value["total"] if value else 0
+                row.append(count)
+                shift_total += count
+            row.append(shift_total)
+            working_days += shift_total
+
+        row.append(working_days)
+        row.extend(allowance_sums(data, set(month_names)))
+        return row
+
+    def stream_csv(self):
+        """
+        Generate the CSV report incrementally: the header is yielded before
+        the database is queried and each employee's row is yielded as soon as
+        its aggregates are complete, so memory stays flat for large exports.
+        The rows and their order are the same as `convert_to_csv`.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+
+        def flush():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return chunk
+
+        writer.writerow(self.header())
+        yield flush()
+
+        for row in self.iter_rows():
+            writer.writerow(row)
+            yield flush()
+
+    def iter_rows(self):
+        """Yield one report row per employee, in `header()` order, straight from the aggregated data."""
+        for unique_id, months in self.iter_employee_months():
+            yield self.csv_row(self.employee[unique_id], self.month_data(months))
+
+    def export(self, fmt="csv"):
+        """
+        Build the report in one of `EXPORT_FORMATS`. Parquet is written from
+        the column arrays of `build_columns`, with the allowance totals as
+        float64; XLSX is streamed row by row from `iter_rows`, which yields
+        the same rows in the same (unique_id) order; CSV is `run()`.
+
+        Returns:
+            io.BytesIO: The generated file, rewound.
+        """
+        if fmt == "parquet":
+            self.extract_data()
+            return write_parquet(self.header(), self.build_columns(), float_columns=ALLOWANCE_COLUMNS)
+        if fmt == "xlsx":
+            return write_xlsx(self.header(), self.iter_rows(), sheet_name=self.team)
+        return self.run()
+
     def run(self):
         self.extract_data()
         return self.convert_to_csv()
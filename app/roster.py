@@ -0,0 +1,114 @@
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from app import db
+
+ROSTER_PROJECTION = {'_id': 0, 'unique_id': 1, 'name': 1}
+# Counter in the `data_version` collection moved only by the employee mutators.
+EMPLOYEES_VERSION_ID = "employees_version"
+
+
+class RosterCache:
+    """
+    Per-team unique_id -> name maps shared by the shift and report models.
+
+    Entries are tagged with the employees version they were read under and
+    are only served for that version. The employee mutators bump it (and
+    drop their entries locally); other workers notice within
+    `version_ttl` seconds, since the version itself is only re-read that
+    often. The TTL bounds memory for idle teams. Cached rosters are shared,
+    so callers must treat them as read-only.
+    """
+
+    def __init__(self, ttl=300, version_ttl=5):
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.entries = {}
+        self.version = None
+        self.version_expires = 0
+        self.reads = 0
+        self.hits = 0
+        self.version_reads = 0
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config["ROSTER_CACHE_TTL"]
+        self.version_ttl = app.config["ROSTER_VERSION_TTL"]
+
+    def get(self, team):
+        version = self.current_version()
+        roster = self.cached(team, version)
+        if roster is None:
+            roster = self.store(team, {data.get('unique_id'): data.get('name')
+                                       for data in db.employees.find({"team": team}, ROSTER_PROJECTION)}, version)
+        return roster
+
+    def fresh_version(self):
+        """Return the memoized employees version, or None once it is due to be re-read."""
+        with self.lock:
+            if self.version is not None and self.version_expires > time.monotonic():
+                return self.version
+        return None
+
+    def current_version(self):
+        version = self.fresh_version()
+        if version is None:
+            doc = db.data_version.find_one({"_id": EMPLOYEES_VERSION_ID})
+            version = self.note_version(doc.get("version", 0) if doc else 0)
+        return version
+
+    def note_version(self, version, read=True):
+        """Memoize an employees version read from the database (by `current_version` or the async data layer)."""
+        with self.lock:
+            self.version_reads += read
+            self.version = version
+            self.version_expires = time.monotonic() + self.version_ttl
+        return version
+
+    def bump(self):
+        """Move the employees version forward; called by the employee mutators after their write."""
+        doc = db.data_version.find_one_and_update({"_id": EMPLOYEES_VERSION_ID}, {"$inc": {"version": 1}},
+                                                  upsert=True, return_document=ReturnDocument.AFTER)
+        return self.note_version(doc["version"], read=False)
+
+    def cached(self, team, version):
+        """Return the roster cached for `team` under `version`, or None when it has to be read."""
+        with self.lock:
+            entry = self.entries.get(team)
+            if entry and entry[1] == version and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[2]
+        return None
+
+    def store(self, team, roster, version):
+        """
+        Cache a roster read from the database (by `get` or the async data
+        layer). `version` must have been read before the employees were.
+        """
+        with self.lock:
+            self.reads += 1
+            self.entries[team] = (time.monotonic() + self.ttl, version, roster)
+        return roster
+
+    def invalidate(self, *teams):
+        """Drop the given teams, or every team when called without arguments."""
+        with self.lock:
+            if not teams:
+                self.entries.clear()
+            for team in teams:
+                self.entries.pop(team, None)
+
+    def stats(self):
+        with self.lock:
+            # Cache hits that still needed a version read saved nothing.
+            return {"reads": self.reads, "version_reads": self.version_reads,
+                    "saved_reads": max(self.hits - self.version_reads, 0), "teams": len(self.entries)}
+
+
+roster_cache = RosterCache()
+
+
+def get_roster(team):
+    return roster_cache.get(team)
@@ -0,0 +1,84 @@
+import gzip
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the deployment
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/csv", "text/plain"}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that encodes and decodes with orjson when it is installed
+    and falls back to Flask's default provider otherwise, or for any option
+    orjson does not support. Datetimes still go through `default` so they
+    serialize exactly as they do with the default provider.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.keys() - {"indent", "separators"} or kwargs.get("indent") not in (None, 2):
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent") == 2:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def compress_response(response):
+    """
+    `after_request` hook: compress JSON/CSV bodies above COMPRESS_MIN_SIZE
+    with brotli (when installed and accepted) or gzip. Streamed and file
+    responses are left untouched.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    config = current_app.config
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        encoding = "br"
+    elif accepted["gzip"]:
+        encoding = "gzip"
+    else:
+        return response
+
+    data = response.get_data()
+    if len(data) < config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=config["COMPRESS_BR_QUALITY"])
+    else:
+        data = gzip.compress(data, compresslevel=config["COMPRESS_GZIP_LEVEL"])
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+
+    # The encoded body differs byte-for-byte, so a strong validator no longer applies.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
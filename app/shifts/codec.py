@@ -0,0 +1,197 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app import db
+from app.cache import bump_data_version
+from app.config import load_config
+
+# SHIFT_STORAGE "map" keeps the original {"day_N": {"shift": ..., "overwork": ...}}
+# documents; "compact" stores new months as `codes` (one small int per day,
+# index 0 is day_1) plus an `overwork_mask` int with bit i set for day i + 1.
+# Reads and writes handle both formats, so a collection can be migrated in place.
+CODE_FIELDS = {'codes': 1, 'overwork_mask': 1}
+
+
+def storage_config():
+    return current_app.config if has_app_context() else load_config()
+
+
+def compact_storage():
+    """Whether new months are stored in the compact format."""
+    return storage_config()["SHIFT_STORAGE"] == "compact"
+
+
+class ShiftCodes:
+    """Append-only shift name <-> code table persisted in the `shift_codes` collection."""
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_code = {}
+        self.unused_until = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        rows = list(db.shift_codes.find({}, {"_id": 0, "name": 1, "code": 1}))
+        with self.lock:
+            self.by_name = {row["name"]: row["code"] for row in rows}
+            self.by_code = {row["code"]: row["name"] for row in rows}
+
+    def code(self, name):
+        code = self.by_name.get(name)
+        if code is None:
+            self.load()
+            code = self.by_name.get(name)
+        if code is None:
+            candidate = db.data_version.find_one_and_update({"_id": "shift_code"}, {"$inc": {"version": 1}},
+                                                            upsert=True, return_document=ReturnDocument.AFTER)["version"]
+            try:
+                db.shift_codes.update_one({"name": name}, {"$setOnInsert": {"code": candidate}}, upsert=True)
+            except DuplicateKeyError:
+                pass  # Another worker registered the name first; use its code.
+            self.load()
+            code = self.by_name[name]
+        return code
+
+    def in_use(self):
+        """
+        Whether any shift name has a code, i.e. whether compact documents can
+        exist. Codes are never removed, so a positive answer is kept; a
+        negative one is trusted for SHIFT_CODES_RECHECK seconds, so map-only
+        deployments don't read `shift_codes` on every write.
+        """
+        if not self.by_name and time.monotonic() >= self.unused_until:
+            self.load()
+            if not self.by_name:
+                self.unused_until = time.monotonic() + storage_config()["SHIFT_CODES_RECHECK"]
+        return bool(self.by_name)
+
+    def find(self, name):
+        """Return the code of `name` without registering it, or None when no document can use it yet."""
+        code = self.by_name.get(name)
+        if code is None:
+            self.load()
+            code = self.by_name.get(name)
+        return code
+
+    def name(self, code):
+        name = self.by_code.get(code)
+        if name is None:
+            self.load()
+            name = self.by_code.get(code, "")
+        return name
+
+
+shift_codes = ShiftCodes()
+
+
+def day_index(day):
+    return int(day.split("_")[1]) - 1
+
+
+def encode_shifts(shifts):
+    """Encode a `{"day_N": {"shift", "overwork"}}` map as `(codes, overwork_mask)`."""
+    days = sorted(shifts.items(), key=lambda item: day_index(item[0]))
+    codes = [shift_codes.code(work.get("shift", "")) for _, work in days]
+    mask = sum(1 << day_index(day) for day, work in days if work.get("overwork"))
+    return codes, mask
+
+
+def decode_shifts(codes, mask):
+    return {"day_" + str(index + 1): {"shift": shift_codes.name(code), "overwork": bool(mask >> index & 1)}
+            for index, code in enumerate(codes)}
+
+
+def decode_document(data):
+    """Replace `codes`/`overwork_mask` on a shifts document with the API's `shifts` map, in place."""
+    if "codes" in data:
+        data["shifts"] = decode_shifts(data.pop("codes"), data.pop("overwork_mask", 0))
+    return data
+
+
+def storage_fields(shifts):
+    """Fields to store for a full month in the configured format."""
+    if not compact_storage():
+        return {"shifts": shifts}
+    codes, mask = encode_shifts(shifts)
+    return {"codes": codes, "overwork_mask": mask}
+
+
+def compact_writes():
+    """
+    Whether updates need a compact-format request: compact storage is
+    configured, or the collection holds (or is being migrated to) compact
+    documents. Map-only deployments never touch `shift_codes`.
+    """
+    return compact_storage() or shift_codes.in_use()
+
+
+def day_update_requests(key, days, extra, compact=True):
+    """
+    UpdateOne requests writing the `{"day_N": work}` entries onto the document
+    matching `key`. One request is emitted per storage format (the compact one
+    only when `compact`, see `compact_writes`); only the one matching the
+    document's format applies.
+    """
+    by_map = UpdateOne({**key, "shifts": {"$exists": True}},
+                       {"$set": {**{"shifts." + day: work for day, work in days.items()}, **extra}})
+    if not compact:
+        return [by_map]
+
+    set_bits = sum(1 << day_index(day) for day, work in days.items() if work.get("overwork"))
+    clear_bits = sum(1 << day_index(day) for day, work in days.items() if not work.get("overwork"))
+    update = {"$set": {**{f"codes.{day_index(day)}": shift_codes.code(work.get("shift", "")) for day, work in days.items()},
+                       **extra}}
+    bits = {}
+    if clear_bits:
+        bits["and"] = ~clear_bits
+    if set_bits:
+        bits["or"] = set_bits
+    if bits:
+        update["$bit"] = {"overwork_mask": bits}
+
+    return [by_map, UpdateOne({**key, "codes": {"$exists": True}}, update)]
+
+
+def full_update_requests(key, shifts, extra, compact=True):
+    """Like `day_update_requests` but replacing the whole month."""
+    by_map = UpdateOne({**key, "shifts": {"$exists": True}}, {"$set": {"shifts": shifts, **extra}})
+    if not compact:
+        return [by_map]
+
+    codes, mask = encode_shifts(shifts)
+    return [by_map, UpdateOne({**key, "codes": {"$exists": True}}, {"$set": {"codes": codes, "overwork_mask": mask, **extra}})]
+
+
+def migrate_storage(compact=True, batch_size=500):
+    """
+    Convert every shifts document to the compact format (or back to day maps).
+
+    Returns:
+        int: Number of documents converted.
+    """
+    source = "shifts" if compact else "codes"
+    converted = 0
+    requests = []
+
+    for data in db.shifts.find({source: {"$exists": True}}, {"_id": 1, "shifts": 1, **CODE_FIELDS}):
+        if compact:
+            codes, mask = encode_shifts(data["shifts"])
+            update = {"$set": {"codes": codes, "overwork_mask": mask}, "$unset": {"shifts": ""}}
+        else:
+            update = {"$set": {"shifts": decode_shifts(data["codes"], data.get("overwork_mask", 0))},
+                      "$unset": {"codes": "", "overwork_mask": ""}}
+        requests.append(UpdateOne({"_id": data["_id"], source: {"$exists": True}}, update))
+
+        if len(requests) >= batch_size:
+            converted += db.shifts.bulk_write(requests, ordered=False).modified_count
+            requests = []
+
+    if requests:
+        converted += db.shifts.bulk_write(requests, ordered=False).modified_count
+    if converted:
+        bump_data_version()
+    return converted
@@ -1,12 +1,43 @@
-from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from app import db
+from app.aio import adb, fetch_grid_state, fetch_teams, shift_grid, shift_history
+from app.cache import bump_data_version
+from app.rates import rate_table
+from app.roster import roster_cache, get_roster
+from app.report.models import rebuild_calendar, record_month, refresh_team_calendar
+from app.report.summaries import refresh_month_summaries, refresh_shift_summaries, refresh_summaries
+from app.shifts.codec import (
+    compact_writes, day_update_requests, full_update_requests, storage_fields
+)
 import uuid
 import calendar
+from datetime import datetime, timezone
+from functools import cached_property
+
+IMPORT_BATCH_SIZE = 1000
+
+class AllowanceConflict(ValueError):
+    """An allowance write would duplicate another row's shift (or unique_id)."""
+
+    def __init__(self, key=None):
+        fields = ", ".join(f"{field} {value!r}" for field, value in (key or {}).items())
+        super().__init__(f"An allowance with {fields or 'this shift'} already exists")
+
+def next_revision():
+    """Return the next value of the global shifts revision counter stored on every written shifts document."""
+    return db.data_version.find_one_and_update({"_id": "shift_revision"}, {"$inc": {"version": 1}},
+                                               upsert=True, return_document=ReturnDocument.AFTER)["version"]
 
 class Shifts:
     def __init__(self, team):
         self.team = team
-        self.employee = { data.get('unique_id'): data.get('name') for data in  db.employees.find({"team": team}, {'_id': 0}) }
+
+    @cached_property
+    def employee(self):
+        # Loaded on first use, so requests answered from `grid_state` alone
+        # (e.g. a 304) never read the roster.
+        return get_roster(self.team)
     
     def get_employee_name_from_data(self, data):
         unique_id = data.get('unique_id')
@@ -19,28 +50,61 @@ class Shifts:
         data['name'] = name
         return data
     
-    def extract_shift(self, month: int, year: int):
-        unique_id = list(self.employee.keys())
-        return [self.get_employee_name_from_data(shift) for shift in db.shifts.find({'month': int(month), 'year': int(year),
-                                                                                    "unique_id": {"$in": unique_id}},
-                                                                                    {'_id': 0, 'unique_id': 1, 'shifts': 1})]
+    def extract_shift(self, month: int, year: int, unique_ids=None, since=None, page=None, page_size=None):
+        return adb.run(shift_grid(self.team, month, year, unique_ids, since, page, page_size))
+
+    def grid_state(self, month: int, year: int):
+        """Return `(count, revision)` for the team's month; see `app.aio.fetch_grid_state`."""
+        return adb.run(fetch_grid_state(self.team, month, year))
 
     def generate_shift(self, month, year):
+        unique_ids = list(self.employee)
+        if not unique_ids:
+            # Unknown or empty team: nothing to write, so nothing to invalidate.
+            return []
+
         _, num_days = calendar.monthrange(year, month)
 
-        random_shift = db.allowance.find_one({}, {'_id': 0, 'shift': 1}).get('shift', '')
+        rates = rate_table.rows()
+        random_shift = rates[0].get('shift', '') if rates else ''
+        shifts = {"day_" + str(day): {"shift": random_shift, "overwork": False} for day in range(1, num_days + 1)}
+        stored = storage_fields(shifts)
+        # Stored on the inserted documents, so it is taken before the write; an unused number is only a gap.
+        revision, now = next_revision(), datetime.now(timezone.utc)
 
-        for unique_id, name in self.employee.items():
-            data = {"unique_id": unique_id, "month": month, "year": year, "total_days": num_days}
-            shifts = {}
-            for day in range(1, num_days + 1):
-                shifts["day_" + str(day)] = {"shift": random_shift, "overwork": False}
-            data["shifts"] = shifts
+        requests = []
+        for unique_id in unique_ids:
+            key = {"unique_id": unique_id, "month": month, "year": year}
+            # `team` is also stamped on months that already exist, e.g. before `backfill-team` has run.
+            requests.append(UpdateOne(key, {"$set": {"team": self.team},
+                                            "$setOnInsert": {"total_days": num_days, **stored,
+                                                             "revision": revision, "updated_at": now}}, upsert=True))
 
-            db.shifts.insert_one(data)
+        try:
+            result = db.shifts.bulk_write(requests, ordered=False)
+            upserted, modified = set(result.upserted_ids), result.modified_count
+        except BulkWriteError as e:
+            # A concurrent request generated the same month first; its upsert won the unique index.
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+            upserted = {upsert['index'] for upsert in e.details.get('upserted', [])}
+            modified = e.details.get('nModified', 0)
 
-        return self.extract_shift(month, year)
+        try:
+            if upserted:
+                record_month(self.team, year, month)
+                refresh_month_summaries(month, year, [unique_ids[index] for index in upserted])
+        finally:
+            # The shifts are written either way; cached results must not outlive them.
+            if upserted or modified:
+                bump_data_version()
 
+        # Rows that already existed are returned as stored, not as the generated default.
+        existing = [unique_id for index, unique_id in enumerate(unique_ids) if index not in upserted]
+        stored_rows = {row['unique_id']: row for row in self.extract_shift(month, year, existing)} if existing else {}
+        return [stored_rows.get(unique_id) or
+                self.get_employee_name_from_data({"unique_id": unique_id, "shifts": shifts, "revision": revision})
+                for unique_id in unique_ids]
 
     def get_shifts(self, month: int, year: int):
         shifts = self.extract_shift(month, year)
@@ -51,91 +115,339 @@ class Shifts:
         return shifts
     
     def get_shift_history(self, unique_id: str, year: int):
-        history = [shift for shift in db.shifts.find({'unique_id': unique_id, 'year': int(year)}, {'_id': 0, 'shifts': 1, 'month': 1, 'year': 1})]
-        return {'name': self.employee.get(unique_id, 'UNKNOWN'), 'history': history}
+        return adb.run(shift_history(self.team, unique_id, year))
     
 def diff_shifts():
-    return [shift.get('shift') for shift in db.allowance.find({}, {'_id': 0, 'shift': 1})]
+    return [shift.get('shift') for shift in rate_table.rows()]
 
 def all_allowance():
-    return [data for data in db.allowance.find({}, {'_id': 0})]
+    return rate_table.rows()
 
 def update_allowance(data):
+    """
+    Apply an edited allowance table in one bulk_write: rows marked `changed`
+    are upserted by unique_id, other rows are inserted only if their shift
+    has no rate yet.
+
+    Returns:
+        list: The allowance table after the write.
+    """
+    requests = []
+    insert_only = set()
+    shift_names = []
     for allowance in data:
-        if allowance.get('changed') and db.allowance.find_one({'unique_id': allowance.get('unique_id')}):
-            allowance.pop('changed')
-            db.allowance.update_one({'unique_id': allowance.get('unique_id')}, {'$set': allowance})
+        changed = allowance.pop('changed', False)
+        if changed and allowance.get('unique_id'):
+            previous = rate_table.by_unique_id(allowance['unique_id']) or {}
+            shift_names.append({allowance.get('shift'), previous.get('shift')})
+            requests.append(UpdateOne({'unique_id': allowance['unique_id']}, {'$set': allowance}, upsert=True))
         else:
-            unique_id = uuid.uuid4()
-            
-            if db.allowance.find_one({'unique_id': unique_id}):
-                raise ValueError("Unique id already exist...")
-            
-            allowance['unique_id'] = unique_id
-            allowance.pop('changed')
-            db.allowance.insert_one(allowance)
+            fields = {key: value for key, value in allowance.items() if key not in ('shift', 'unique_id')}
+            insert_only.add(len(requests))
+            shift_names.append({allowance.get('shift', '')})
+            requests.append(UpdateOne({'shift': allowance.get('shift', '')},
+                                      {'$setOnInsert': {**fields, 'unique_id': str(uuid.uuid4())}}, upsert=True))
+
+    return write_allowances(requests, insert_only, shift_names)
+
+def write_allowances(requests, insert_only=None, shift_names=None):
+    """
+    Run allowance upserts as one unordered bulk_write backed by the unique
+    `shift` and `unique_id` indexes, then refresh the rate table and, if any
+    rate changed, the summaries of the shifts involved.
+
+    Args:
+        requests (list): UpdateOne upserts.
+        insert_only (set): Indexes of the `$setOnInsert`-by-shift requests
+            (all of them when None). A duplicate key on one of those only
+            means the shift was inserted concurrently; on any other request
+            it is a real conflict.
+        shift_names (list): Per request, the shift names whose rates it may
+            change. An insert-only request only counts when it inserted.
+
+    Returns:
+        list: The allowance table after the write.
+
+    Raises:
+        AllowanceConflict: An edited row collides with an existing shift.
+    """
+    if not requests:
+        return all_allowance()
+
+    insert_only = set(range(len(requests))) if insert_only is None else insert_only
+    conflicts = []
+    try:
+        result = db.allowance.bulk_write(requests, ordered=False)
+        changed = result.upserted_count + result.modified_count
+        upserted = set(result.upserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != 11000 for error in errors):
+            raise
+        conflicts = [error for error in errors if error['index'] not in insert_only]
+        changed = e.details.get('nUpserted', 0) + e.details.get('nModified', 0)
+        upserted = {upsert['index'] for upsert in e.details.get('upserted', [])}
+
+    rates = rate_table.refresh()
+    if changed:
+        failed = {error['index'] for error in conflicts}
+        names = set()
+        for index, shifts in enumerate(shift_names or []):
+            if index in upserted or (index not in insert_only and index not in failed):
+                names |= shifts
+        refresh_shift_summaries(names)
+        bump_data_version()
+    if conflicts:
+        raise AllowanceConflict(conflicts[0].get('keyValue'))
+    return rates.rows
 
 def update_allowanceV2(data):
-    db.allowance.update_one({'unique_id': data.get('unique_id')}, {'$set': data})
+    previous = rate_table.by_unique_id(data.get('unique_id')) or {}
+    try:
+        result = db.allowance.update_one({'unique_id': data.get('unique_id')}, {'$set': data})
+    except DuplicateKeyError as e:
+        raise AllowanceConflict((e.details or {}).get('keyValue'))
+    rate_table.refresh()
+    if result.modified_count:
+        refresh_shift_summaries({data.get('shift'), previous.get('shift')})
+        bump_data_version()
 
 def insert_allowance(allowance):
     unique_id = str(uuid.uuid4())
     
-    if db.allowance.find_one({'unique_id': unique_id}):
+    if rate_table.by_unique_id(unique_id):
         raise ValueError("Unique id already exist...")
     
     allowance['unique_id'] = unique_id
 
-    db.allowance.insert_one(allowance)
+    try:
+        db.allowance.insert_one(allowance)
+    except DuplicateKeyError as e:
+        raise AllowanceConflict((e.details or {}).get('keyValue'))
+    rate_table.refresh()
+    refresh_shift_summaries([allowance.get('shift')])
+    bump_data_version()
 
 def delete_allowance(unique_id):
-    db.allowance.delete_one({"unique_id": unique_id})
+    deleted = db.allowance.find_one_and_delete({"unique_id": unique_id}, {'_id': 0, 'shift': 1})
+    rate_table.refresh()
+    if deleted:
+        refresh_shift_summaries([deleted.get('shift')])
+        bump_data_version()
 
 def change_shift(month, year, data):
+    """
+    Write edited shifts as per-day `$set`s in one unordered bulk_write, in
+    whichever storage format (day map or compact codes) each document uses.
 
+    Days carrying the `changed` marker are the only ones written, so rows may
+    contain just their edited days. When no day in the payload is marked, each
+    row's full shift map is written as before.
+
+    Returns:
+        list: unique_ids of the employees whose shifts were written.
+    """
+    has_markers = any("changed" in work for shift in data for work in shift["shifts"].values())
+
+    writes = []
     for shift in data:
-        for day, work  in shift["shifts"].items():
+        changes = {}
+        for day, work in shift["shifts"].items():
             if "changed" in work.keys():
                 work.pop("changed")
+                changes[day] = work
 
-        db.shifts.update_one({'unique_id': shift.get('unique_id'), 'month': int(month), 'year': int(year)},
-                            {'$set': {'shifts': shift.get('shifts')}})
-                            
-def adding_allowance(data):
-    for allowance in data:
-        if db.allowance.find_one({'shift': allowance.get('shift', '')}):
-            continue
-        unique_id = str(uuid.uuid4())
+        key = {'unique_id': shift.get('unique_id'), 'month': int(month), 'year': int(year)}
+        if not has_markers:
+            writes.append((key, full_update_requests, shift.get('shifts')))
+        elif changes:
+            writes.append((key, day_update_requests, changes))
+
+    affected = [key['unique_id'] for key, _, _ in writes]
+    if not writes:
+        return affected
 
-        db.allowance.insert_one({'unique_id': unique_id, 'shift': allowance.get('shift', ''), 'allowance': allowance.get('allowance', ''),
-                                'overwork_allowance': allowance.get('overwork_allowance', ''), 'work': allowance.get('work', False)})
-    return all_allowance()
+    # A revision is only taken, and cached results only invalidated, when something is written.
+    extra = {'revision': next_revision(), 'updated_at': datetime.now(timezone.utc)}
+    compact = compact_writes()
+    requests = []
+    for key, build_requests, days in writes:
+        requests.extend(build_requests(key, days, extra, compact))
+    db.shifts.bulk_write(requests, ordered=False)
+
+    try:
+        refresh_month_summaries(month, year, affected)
+    finally:
+        # The shifts are written either way; cached results must not outlive them.
+        bump_data_version()
+    return affected
+
+def adding_allowance(data):
+    return write_allowances([
+        UpdateOne({'shift': allowance.get('shift', '')},
+                  {'$setOnInsert': {'unique_id': str(uuid.uuid4()), 'allowance': allowance.get('allowance', ''),
+                                    'overwork_allowance': allowance.get('overwork_allowance', ''),
+                                    'work': allowance.get('work', False)}},
+                  upsert=True)
+        for allowance in data
+    ], shift_names=[{allowance.get('shift', '')} for allowance in data])
 
 def employees():
     return [data for data in db.employees.find({}, {'_id': 0})]
 
 def add_new_employee(new_employees):
-    for employee in new_employees:
-        already_exist = db.employees.find_one({"name": employee["name"], "team":employee["team"]})
+    import_employees(new_employees)
+    return employees()
+
+def import_employees(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Insert employees in bulk, skipping (name, team) pairs that already exist.
+
+    Existing pairs are found with one query for the whole upload and rows
+    are written with unordered insert_many batches; the unique (name, team)
+    index catches anything inserted concurrently.
+
+    Args:
+        rows (list): Dicts with `name` and `team`.
+        batch_size (int): Maximum documents per insert_many.
+
+    Returns:
+        list: One result per input row with its `status` (inserted, skipped or failed).
+    """
+    results = [None] * len(rows)
+    candidates = []
+    seen = set()
 
-        if already_exist:
+    for index, row in enumerate(rows):
+        name = row.get("name") if isinstance(row, dict) else None
+        team = row.get("team") if isinstance(row, dict) else None
+        if not isinstance(name, str) or not isinstance(team, str) or not name or not team:
+            results[index] = {"row": index, "status": "failed", "reason": "'name' and 'team' are required"}
             continue
-    
-        unique_id = str(uuid.uuid4())
+        if (name, team) in seen:
+            results[index] = {"row": index, "name": name, "team": team, "status": "skipped", "reason": "duplicate in upload"}
+            continue
+        seen.add((name, team))
+        candidates.append((index, name, team))
 
-        db.employees.insert_one({"name": employee["name"], "team":employee["team"], "unique_id": unique_id})
+    existing = set()
+    if candidates:
+        query = {"name": {"$in": list({name for _, name, _ in candidates})},
+                 "team": {"$in": list({team for _, _, team in candidates})}}
+        existing = {(data["name"], data["team"]) for data in db.employees.find(query, {"_id": 0, "name": 1, "team": 1})}
 
-    return employees()
+    pending = []
+    for index, name, team in candidates:
+        if (name, team) in existing:
+            results[index] = {"row": index, "name": name, "team": team, "status": "skipped", "reason": "already exists"}
+        else:
+            pending.append((index, {"name": name, "team": team, "unique_id": str(uuid.uuid4())}))
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        errors = {}
+        try:
+            db.employees.insert_many([doc for _, doc in batch], ordered=False)
+        except BulkWriteError as e:
+            errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+        for position, (index, doc) in enumerate(batch):
+            result = {"row": index, "name": doc["name"], "team": doc["team"]}
+            error = errors.get(position)
+            if error is None:
+                result.update(status="inserted", unique_id=doc["unique_id"])
+            elif error.get("code") == 11000:
+                result.update(status="skipped", reason="already exists")
+            else:
+                result.update(status="failed", reason=error.get("errmsg", "insert failed"))
+            results[index] = result
+
+    inserted_teams = {result["team"] for result in results if result["status"] == "inserted"}
+    if inserted_teams:
+        roster_cache.invalidate(*inserted_teams)
+        roster_cache.bump()
+        bump_data_version()
+
+    return results
 
 def edit_employee(employee):
-    db.employees.update_one({"unique_id": employee["unique_id"]}, {"$set": {"name": employee["name"], "team": employee["team"]}})
+    previous = db.employees.find_one_and_update({"unique_id": employee["unique_id"]},
+                                                {"$set": {"name": employee["name"], "team": employee["team"]}},
+                                                projection={"_id": 0, "name": 1, "team": 1})
+    if not previous or (previous.get("name"), previous.get("team")) == (employee["name"], employee["team"]):
+        # Unknown employee or nothing changed: no cached roster, grid or report is stale.
+        return
+
+    # Move the employees version before the revision, so no worker can see
+    # the new revision while still serving a roster cached under the old one.
+    roster_cache.bump()
+    # Renames and team moves both change what the grid shows, so they move the revision too.
+    db.shifts.update_many({"unique_id": employee["unique_id"]},
+                          {"$set": {"team": employee["team"], "revision": next_revision(),
+                                    "updated_at": datetime.now(timezone.utc)}})
+    if previous.get("team") != employee["team"]:
+        refresh_team_calendar(employee["team"], previous.get("team"))
+    roster_cache.invalidate(employee["team"], previous.get("team"))
+    bump_data_version()
 
 def remove_employee(data):
-    db.employees.delete_one({"unique_id": data["unique_id"]})
+    removed = db.employees.find_one_and_delete({"unique_id": data["unique_id"]}, projection={"_id": 0, "team": 1})
+    if not removed:
+        return
+
+    db.shifts.update_many({"unique_id": data["unique_id"]},
+                          {"$unset": {"team": ""}, "$set": {"revision": next_revision(), "updated_at": datetime.now(timezone.utc)}})
+    refresh_team_calendar(removed.get("team"))
+    roster_cache.invalidate(removed.get("team"))
+    roster_cache.bump()
+    bump_data_version()
+
+def dedupe_shift_months(dry_run=False):
+    """
+    Delete duplicate shifts documents for the same (unique_id, year, month),
+    keeping the newest one (latest `updated_at`, then latest `_id`), so the
+    unique month index can be built.
+
+    Returns:
+        int: Number of documents removed (or that would be removed with `dry_run`).
+    """
+    duplicates = list(db.shifts.aggregate([
+        {"$sort": {"updated_at": -1, "_id": -1}},
+        {"$group": {"_id": {"unique_id": "$unique_id", "year": "$year", "month": "$month"},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True))
+
+    stale = [_id for group in duplicates for _id in group["ids"][1:]]
+    if dry_run or not stale:
+        return len(stale)
+
+    db.shifts.delete_many({"_id": {"$in": stale}})
+    refresh_summaries({"$or": [group["_id"] for group in duplicates]})
+    bump_data_version()
+    return len(stale)
 
 def get_teams():
-    return db.portal_manager.find_one({"_id": ObjectId("673852c639119f5963cd46d8")}, {"_id": 0, "teams": 1})
+    return adb.run(fetch_teams())
 
+def backfill_shift_teams():
+    """
+    Copy each employee's current team onto their `shifts` documents, clear
+    it from documents of employees that no longer exist, and rebuild the
+    month calendar from the result.
 
-    
-    
\ No newline at end of file
+    Returns:
+        int: Number of shifts documents modified.
+    """
+    requests = []
+    unique_ids = []
+    for employee in db.employees.find({}, {"_id": 0, "unique_id": 1, "team": 1}):
+        unique_ids.append(employee.get("unique_id"))
+        requests.append(UpdateMany({"unique_id": employee.get("unique_id"), "team": {"$ne": employee.get("team")}},
+                                   {"$set": {"team": employee.get("team")}}))
+    requests.append(UpdateMany({"unique_id": {"$nin": unique_ids}, "team": {"$exists": True}}, {"$unset": {"team": ""}}))
+
+    modified = db.shifts.bulk_write(requests, ordered=False).modified_count
+    # Rebuilding the calendar also moves the data version past these writes.
+    rebuild_calendar()
+    return modified
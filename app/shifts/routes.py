@@ -1,13 +1,23 @@
 from __future__ import annotations
-from flask import Blueprint, request, jsonify
+import csv
+import hashlib
+import io
+import click
+from flask import Blueprint, request, jsonify, make_response
 from app.shifts.models import (
-    Shifts, adding_allowance, change_shift, delete_allowance, diff_shifts, 
-    all_allowance, edit_employee, employees, get_teams, insert_allowance, 
-    remove_employee, update_allowance, add_new_employee, update_allowanceV2
+    AllowanceConflict, Shifts, adding_allowance, backfill_shift_teams, change_shift, delete_allowance, diff_shifts, 
+    dedupe_shift_months, all_allowance, edit_employee, employees, get_teams, insert_allowance, 
+    remove_employee, update_allowance, add_new_employee, update_allowanceV2, import_employees
 )
 from app import db
+from app.serialization import compress_response
+from app.aio import ASYNC_VIEWS, adb, dashboard, fetch_grid_state, shift_history
+from app.cache import data_version
+from app.roster import roster_cache
+from app.shifts.codec import migrate_storage
 
 shifts = Blueprint('shifts', __name__)
+shifts.after_request(compress_response)
 
 def handle_error(message: str, status_code: int):
     """Utility function to create error responses."""
@@ -15,10 +25,45 @@ def handle_error(message: str, status_code: int):
     response.status_code = status_code
     return response
 
+GRID_OPTIONS_ERROR = "Invalid input: 'since' must be a non-negative integer, 'page' and 'page_size' positive integers"
+
+def grid_options(data):
+    """Return `(since, page, page_size)` from a grid request, or None when one of them is invalid."""
+    since = data.get("since")
+    page = data.get("page")
+    page_size = data.get("page_size")
+    for value, lowest in ((since, 0), (page, 1), (page_size, 1)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < lowest):
+            return None
+    return since, page or 1, page_size
+
+def generated_grid(shifts, month, year, since, page, page_size):
+    """
+    Generate the team's month and answer from the rows it wrote (or found),
+    without reading them back: `(rows, count, revision)` with the `since`
+    and paging filters of `Shifts.extract_shift` applied to the rows.
+    """
+    rows = shifts.generate_shift(month, year)
+    count, revision = len(rows), max((row.get('revision') or 0 for row in rows), default=0)
+    if since is not None:
+        rows = [row for row in rows if (row.get('revision') or 0) > since]
+    if page_size:
+        rows = sorted(rows, key=lambda row: row['unique_id'])[(page - 1) * page_size:page * page_size]
+    return rows, count, revision
+
+def grid_etag(*state):
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
 @shifts.route('/<month>/<year>', methods=['POST'])
 def get_shifts(month: str, year: str):
     """
     Fetch shifts for a given month and year.
+
+    The response carries an ETag built from the grid's row count, latest
+    revision and the employees version; a matching If-None-Match returns 304
+    without reading the rows.
+    Optional JSON fields: `since` returns only rows with a newer revision,
+    `page`/`page_size` page through the team ordered by unique_id.
     
     Args:
         month (str): Month as a string.
@@ -34,14 +79,107 @@ def get_shifts(month: str, year: str):
         team = data.get("team", "")
         if not team:
             return handle_error("Invalid input: 'team' field is required", 400)
-        
+
+        options = grid_options(data)
+        if options is None:
+            return handle_error(GRID_OPTIONS_ERROR, 400)
+        since, page, page_size = options
+
+        month, year = int(month), int(year)
         shifts = Shifts(team)
-        return jsonify({'shifts': shifts.get_shifts(int(month), int(year))})
+        count, revision = shifts.grid_state(month, year)
+        rows = None
+        if not count:
+            rows, count, revision = generated_grid(shifts, month, year, since, page, page_size)
+
+        # The employees version covers renames seen late by this worker (see RosterCache).
+        etag = grid_etag(team, month, year, count, revision, roster_cache.current_version(), since, page, page_size)
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            if rows is None:
+                rows = shifts.extract_shift(month, year, since=since, page=page, page_size=page_size)
+            response = jsonify({'shifts': rows, 'revision': revision, 'count': count})
+        response.set_etag(etag)
+        return response
     except ValueError:
         return handle_error("Invalid input: Month and year must be integers", 400)
     except Exception as e:
         return handle_error(str(e), 500)
 
+async def dashboard_data():
+    """
+    Fetch the shift grid, allowance table and team list in one call; the
+    underlying queries run concurrently on the async data layer.
+
+    The grid is generated on first access and accepts `since`/`page`/
+    `page_size` like `get_shifts`. The ETag also covers the data version,
+    since the allowance table and team list can change without the grid.
+
+    Returns:
+        Response: JSON response with shifts, allowance and teams, or error message.
+    """
+    try:
+        data = request.json
+        if not data:
+            return handle_error("Invalid input: No JSON data found", 400)
+        team = data.get("team", "")
+        if not team:
+            return handle_error("Invalid input: 'team' field is required", 400)
+
+        options = grid_options(data)
+        if options is None:
+            return handle_error(GRID_OPTIONS_ERROR, 400)
+
+        month, year = int(data.get("month")), int(data.get("year"))
+        count, revision = await adb.call(fetch_grid_state(team, month, year))
+        rows = None
+        if not count:
+            rows, count, revision = generated_grid(Shifts(team), month, year, *options)
+
+        etag = grid_etag(team, month, year, count, revision, data_version(), *options)
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = jsonify({**await adb.call(dashboard(team, month, year, *options, grid=rows)),
+                                'revision': revision, 'count': count})
+        response.set_etag(etag)
+        return response
+    except (TypeError, ValueError):
+        return handle_error("Invalid input: Month and year must be integers", 400)
+    except Exception as e:
+        return handle_error(str(e), 500)
+
+async def shift_history_data(unique_id: str, year: str):
+    """
+    Fetch one employee's shifts for every generated month of a year.
+
+    Args:
+        unique_id (str): Employee unique id.
+        year (str): Year as a string.
+
+    Returns:
+        Response: JSON response with the employee name and history, or error message.
+    """
+    try:
+        data = request.json
+        if not data:
+            return handle_error("Invalid input: No JSON data found", 400)
+        team = data.get("team", "")
+        if not team:
+            return handle_error("Invalid input: 'team' field is required", 400)
+
+        return jsonify(await adb.call(shift_history(team, unique_id, int(year))))
+    except ValueError:
+        return handle_error("Invalid input: Year must be an integer", 400)
+    except Exception as e:
+        return handle_error(str(e), 500)
+
+# Async views need the flask[async] extra; without it they are not served at all (create_app logs this).
+if ASYNC_VIEWS:
+    shifts.add_url_rule('dashboard', view_func=dashboard_data, methods=['POST'])
+    shifts.add_url_rule('history/<unique_id>/<year>', view_func=shift_history_data, methods=['POST'])
+
 @shifts.route('/get_shifts', methods=['GET'])
 def all_shifts():
     """Fetch all shifts."""
@@ -68,13 +206,15 @@ def change_allowance():
         
         update_allowanceV2(data)
         return jsonify({'status': 'Successfully updated data', 'data': all_allowance()})
+    except AllowanceConflict as e:
+        return handle_error(str(e), 409)
     except KeyError as e:
         return handle_error(f"Missing key: {e}", 400)
     except Exception as e:
         return handle_error(str(e), 500)
 
 @shifts.route('/insert_allowance', methods=['POST'])
-def adding_allowance():
+def insert_new_allowance():
     """Insert a new allowance."""
     try:
         data = request.json
@@ -83,6 +223,8 @@ def adding_allowance():
         
         insert_allowance(data)
         return jsonify({'status': 'Successfully inserted data', 'data': all_allowance()})
+    except AllowanceConflict as e:
+        return handle_error(str(e), 409)
     except KeyError as e:
         return handle_error(f"Missing key: {e}", 400)
     except Exception as e:
@@ -103,7 +245,12 @@ def remove_allowance():
 
 @shifts.route('/update_shifts', methods=['POST'])
 def update_shifts():
-    """Update shifts for a given month and year."""
+    """
+    Update shifts for a given month and year.
+
+    Only days marked `changed` are written. With `"affected_only": true` the
+    response holds just the rows that were written instead of the full grid.
+    """
     try:
         data = request.json
         if not data:
@@ -117,8 +264,11 @@ def update_shifts():
         if not month or not year:
             return handle_error("Invalid input: 'month' and 'year' are required", 400)
         
-        change_shift(month, year, shift_data)
+        affected = change_shift(month, year, shift_data)
         shifts = Shifts(team)
+        if data.get('affected_only'):
+            return jsonify({'status': 'Successfully updated shifts data',
+                            'shifts': shifts.extract_shift(int(month), int(year), affected)})
         return jsonify({'status': 'Successfully updated shifts data', 'shifts': shifts.get_shifts(int(month), int(year))})
     except ValueError:
         return handle_error("Invalid input: Month and year must be integers", 400)
@@ -134,6 +284,8 @@ def add_allowance():
             return handle_error("Invalid input: No JSON data found", 400)
         
         return jsonify({'data': adding_allowance(data)})
+    except AllowanceConflict as e:
+        return handle_error(str(e), 409)
     except Exception as e:
         return handle_error(str(e), 500)
 
@@ -184,6 +336,32 @@ def add_employee_data():
     except Exception as e:
         return handle_error(str(e), 500)
 
+@shifts.route('import_employees', methods=['POST'])
+def import_employee_data():
+    """
+    Bulk import employees from a JSON body (`{"employees": [...]}`) or an
+    uploaded CSV file (`file`, with `name` and `team` columns).
+
+    Returns:
+        Response: JSON response with per-row results and status counts, or error message.
+    """
+    try:
+        if "file" in request.files:
+            upload = io.TextIOWrapper(request.files["file"].stream, encoding="utf-8-sig")
+            rows = list(csv.DictReader(upload))
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get("employees"), list):
+                return handle_error("Invalid input: 'employees' list or CSV 'file' is required", 400)
+            rows = data["employees"]
+
+        results = import_employees(rows)
+        summary = {status: sum(1 for result in results if result["status"] == status)
+                   for status in ("inserted", "skipped", "failed")}
+        return jsonify({"summary": summary, "results": results, "status": "success"})
+    except Exception as e:
+        return handle_error(str(e), 500)
+
 @shifts.route('teams', methods=['GET'])
 def get_teams_list():
     """Fetch all teams."""
@@ -191,3 +369,23 @@ def get_teams_list():
         return jsonify(get_teams())
     except Exception as e:
         return handle_error(str(e), 500)
+
+@shifts.cli.command('backfill-team')
+def backfill_team_command():
+    """Copy each employee's team onto their shifts documents."""
+    modified = backfill_shift_teams()
+    click.echo(f"Updated team on {modified} shifts documents")
+
+@shifts.cli.command('dedupe-months')
+@click.option('--dry-run', is_flag=True, help='Only count the duplicates.')
+def dedupe_months_command(dry_run: bool):
+    """Remove duplicate shifts documents per employee and month, keeping the newest (run before `indexes ensure`)."""
+    removed = dedupe_shift_months(dry_run=dry_run)
+    click.echo(f"{'Found' if dry_run else 'Removed'} {removed} duplicate shifts documents")
+
+@shifts.cli.command('encode-storage')
+@click.option('--decode', is_flag=True, help='Convert compact documents back to day maps.')
+def encode_storage_command(decode: bool):
+    """Convert shifts documents to the compact codes + overwork bitmask format."""
+    converted = migrate_storage(compact=not decode)
+    click.echo(f"Converted {converted} shifts documents")
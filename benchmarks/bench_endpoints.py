@@ -0,0 +1,280 @@
+"""
+Time the main shifts, report and auth endpoints through the Flask test
+client against seeded synthetic data.
+
+    python -m benchmarks.bench_endpoints --teams 4 --employees 250 --years 2 \\
+        --save benchmarks/baseline.json
+    python -m benchmarks.bench_endpoints --compare benchmarks/baseline.json
+
+`--backend mongod` (default) uses MONGO_URI and drops/reseeds `--db`.
+`--backend mongomock` runs in memory; mongomock lacks `$merge` and other
+server-side stages, so summary-backed report timings are only meaningful
+against a real mongod. Each scenario reports p50/p95 latency over the timed
+runs and the peak Python allocation (tracemalloc) of one extra traced run.
+A scenario whose requests return an error status is reported as failed:
+its timings are neither saved nor compared, and the run exits non-zero.
+Report scenarios are skipped (not timed, saved or compared) when the
+summaries could not be built, since they would time empty reports.
+"""
+import argparse
+import calendar
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.aio import TEAMS_DOCUMENT_ID
+from app.cache import bump_data_version
+from app.indexes import ensure_indexes
+from app.rates import rate_table
+from app.report.models import rebuild_calendar
+from app.report.summaries import rebuild_summaries
+from app.roster import roster_cache
+from app.shifts.codec import storage_fields
+
+SHIFTS = ["night", "afternoon", "general", "planned", "restricted", "holiday"]
+PAID_SHIFTS = {"night": (150, 300), "afternoon": (100, 200), "general": (0, 250), "holiday": (0, 300)}
+BENCH_USER = ("bench", "bench-password")
+
+
+def synthetic_dataset(teams, employees, years, start_year=2024, seed=0):
+    """
+    Generate employees, a full year of `shifts` documents per employee per
+    year, the allowance table and the team list. The same seed always yields
+    the same documents.
+    """
+    rng = random.Random(seed)
+    team_names = [f"team-{index}" for index in range(teams)]
+    staff = [{"name": f"Employee {team}-{index}", "team": team, "unique_id": str(uuid.UUID(int=rng.getrandbits(128)))}
+             for team in team_names for index in range(employees)]
+    allowance = [{"unique_id": str(uuid.UUID(int=rng.getrandbits(128))), "shift": shift,
+                  "allowance": rates[0], "overwork_allowance": rates[1], "work": True}
+                 for shift, rates in PAID_SHIFTS.items()]
+
+    shifts = []
+    now = datetime.now(timezone.utc)
+    for year in range(start_year, start_year + years):
+        for month in range(1, 13):
+            num_days = calendar.monthrange(year, month)[1]
+            for employee in staff:
+                days = {f"day_{day}": {"shift": rng.choice(SHIFTS), "overwork": rng.random() < 0.05}
+                        for day in range(1, num_days + 1)}
+                shifts.append({"unique_id": employee["unique_id"], "team": employee["team"], "month": month,
+                               "year": year, "total_days": num_days, "days": days, "revision": 1, "updated_at": now})
+
+    return {"teams": team_names, "employees": staff, "allowance": allowance, "shifts": shifts,
+            "years": list(range(start_year, start_year + years))}
+
+
+def seed(dataset, batch_size=1000):
+    """Load `dataset` into a wiped database; return whether the report summaries could be built."""
+    for name in ("employees", "allowance", "shifts", "shift_summaries", "shift_calendar", "portal_manager", "users"):
+        db[name].delete_many({})
+
+    db.employees.insert_many([dict(employee) for employee in dataset["employees"]])
+    db.allowance.insert_many([dict(row) for row in dataset["allowance"]])
+    db.portal_manager.insert_one({"_id": TEAMS_DOCUMENT_ID, "teams": dataset["teams"]})
+    db.users.insert_one({"username": BENCH_USER[0], "password": generate_password_hash(BENCH_USER[1]),
+                         "registered": int(time.time())})
+
+    batch = []
+    for document in dataset["shifts"]:
+        document = dict(document)
+        batch.append({**document, **storage_fields(document.pop("days"))})
+        if len(batch) >= batch_size:
+            db.shifts.insert_many(batch)
+            batch = []
+    if batch:
+        db.shifts.insert_many(batch)
+
+    try:
+        rebuild_calendar()
+        rebuild_summaries()
+        summaries_built = True
+    except Exception as e:  # mongomock: no $out/$merge
+        print(f"shift_calendar/shift_summaries not built ({e}); report scenarios will be skipped", file=sys.stderr)
+        summaries_built = False
+
+    rate_table.refresh()
+    roster_cache.invalidate()
+    bump_data_version()
+    return summaries_built
+
+
+def scenarios(dataset, rng, cold_cache=True):
+    """
+    Yield `(name, make_request, needs_summaries)`. `make_request()` runs
+    untimed setup and returns the `(method, url, kwargs)` to time.
+    """
+    team = dataset["teams"][0]
+    year = dataset["years"][-1]
+    staff = [employee for employee in dataset["employees"] if employee["team"] == team]
+
+    def cold():
+        if cold_cache:
+            bump_data_version()
+
+    def grid():
+        return "post", f"/shifts/{rng.randint(1, 12)}/{year}", {"json": {"team": team}}
+
+    def update_shifts():
+        month = rng.randint(1, 12)
+        rows = [{"unique_id": employee["unique_id"],
+                 "shifts": {f"day_{rng.randint(1, 28)}": {"shift": rng.choice(SHIFTS), "overwork": False, "changed": True}}}
+                for employee in rng.sample(staff, min(10, len(staff)))]
+        return "post", "/shifts/update_shifts", {"json": {"month": month, "year": year, "team": team, "data": rows,
+                                                          "affected_only": True}}
+
+    def report(months):
+        def make_request():
+            cold()
+            return "post", "/report/generate_csv", {"json": {"months": list(range(1, months + 1)), "year": year,
+                                                             "team": team}}
+        return make_request
+
+    def get_months():
+        cold()
+        return "post", f"/report/get_months/{year}", {"json": {"team": team}}
+
+    def add_employees():
+        suffix = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+        rows = [{"name": f"New {suffix}-{index}", "team": team} for index in range(50)]
+        return "post", "/shifts/add_employees", {"json": {"employees": rows}}
+
+    def login():
+        return "post", "/auth/login", {"json": {"username": BENCH_USER[0], "password": BENCH_USER[1]}}
+
+    yield "grid", grid, False
+    yield "update_shifts", update_shifts, False
+    for months in (1, 6, 12):
+        yield f"generate_csv_{months}m", report(months), True
+    yield "get_months", get_months, False
+    yield "add_employees", add_employees, False
+    yield "login", login, False
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(client, make_request, repeat, warmup=1):
+    timings = []
+    errors = 0
+    for index in range(warmup + repeat):
+        method, url, kwargs = make_request()
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        errors += response.status_code >= 400
+        if index >= warmup:
+            timings.append(elapsed)
+
+    method, url, kwargs = make_request()
+    tracemalloc.start()
+    getattr(client, method)(url, **kwargs).get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"p50_ms": percentile(timings, 0.5) * 1000, "p95_ms": percentile(timings, 0.95) * 1000,
+            "mean_ms": statistics.fmean(timings) * 1000, "peak_kb": peak / 1024, "runs": repeat, "errors": errors}
+
+
+def compare(results, results_params, baseline, tolerance):
+    """Print p95 changes against a saved baseline; return the scenarios that regressed beyond `tolerance`."""
+    regressed = []
+    if baseline.get("params") != results_params:
+        print(f"\nNote: baseline was recorded with {baseline.get('params')}")
+    print(f"\n{'scenario':20} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        change = result["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+        flag = " REGRESSED" if change > tolerance else ""
+        print(f"{name:20} {base['p95_ms']:10.2f} {result['p95_ms']:10.2f} {change:+8.1%}{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mongod", "mongomock"), default="mongod")
+    parser.add_argument("--db", default="hrportal_bench", help="Database to (re)seed; it is wiped first.")
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--employees", type=int, default=100, help="Employees per team.")
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", nargs="*", help="Scenario names to run.")
+    parser.add_argument("--warm-cache", action="store_true", help="Let report endpoints hit the result cache.")
+    parser.add_argument("--save", help="Write results to this JSON baseline file.")
+    parser.add_argument("--compare", help="Compare p95 against this JSON baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown before failing.")
+    args = parser.parse_args()
+
+    app = create_app({"MONGO_DB": args.db, "ENSURE_INDEXES": False, "METRICS_SLOW_MS": 0, "TESTING": True})
+    if args.backend == "mongomock":
+        import mongomock
+        db.use_client(mongomock.MongoClient())
+    ensure_indexes()
+
+    dataset = synthetic_dataset(args.teams, args.employees, args.years, seed=args.seed)
+    print(f"Seeding {len(dataset['employees'])} employees, {len(dataset['shifts'])} shifts documents ...")
+    summaries_built = seed(dataset)
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    results = {}
+    failed = []
+    skipped = []
+    print(f"\n{'scenario':20} {'p50 ms':>10} {'p95 ms':>10} {'peak KB':>10} {'errors':>7}")
+    for name, make_request, needs_summaries in scenarios(dataset, rng, cold_cache=not args.warm_cache):
+        if args.only and name not in args.only:
+            continue
+        if needs_summaries and not summaries_built:
+            skipped.append(name)
+            print(f"{name:20} {'SKIPPED':>10}")
+            continue
+        result = run_scenario(client, make_request, args.repeat)
+        if result["errors"]:
+            # Error responses are usually fast and would make a broken endpoint look like a speedup.
+            failed.append(name)
+            print(f"{name:20} {'FAILED':>10} {'':>10} {'':>10} {result['errors']:7}")
+            continue
+        results[name] = result
+        print(f"{name:20} {result['p50_ms']:10.2f} {result['p95_ms']:10.2f} {result['peak_kb']:10.1f} {result['errors']:7}")
+
+    report = {"params": {key: getattr(args, key) for key in ("backend", "teams", "employees", "years", "seed",
+                                                             "repeat", "warm_cache")},
+              "created": datetime.now(timezone.utc).isoformat(), "results": results, "failed": failed,
+              "skipped": skipped}
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    regressed = []
+    if args.compare:
+        with open(args.compare) as file:
+            regressed = compare(results, report["params"], json.load(file), args.tolerance)
+
+    if skipped:
+        print(f"\nSkipped scenarios, summaries not built (not saved or compared): {', '.join(skipped)}")
+    if failed:
+        print(f"\nFailed scenarios (not saved or compared): {', '.join(failed)}")
+    if failed or regressed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
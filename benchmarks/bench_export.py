@@ -0,0 +1,78 @@
+"""
+Compare generation time and file size of the CSV, Parquet and XLSX report
+exports for a synthetic team, without a database.
+
+    python -m benchmarks.bench_export --employees 5000 --months 12 --repeat 5
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.report.export import format_available
+from app.report.utils import SHIFT_LIST, Report
+
+
+class SyntheticReport(Report):
+    """`Report` fed from generated per-employee month totals instead of MongoDB."""
+
+    def __init__(self, employee_months, months, team="bench", engine="summary"):
+        self.employee = {unique_id: f"Employee {index}" for index, unique_id in enumerate(employee_months)}
+        self.unique_id = list(self.employee)
+        self.employee_months = employee_months
+        self.team = team
+        self.months = months
+        self.year = 2024
+        self.engine = engine
+        self.report_data = {}
+
+    def iter_employee_months(self):
+        yield from self.employee_months.items()
+
+
+def synthetic_months(employees, months, seed=0):
+    rng = random.Random(seed)
+    rates = {"night": 150, "afternoon": 100, "holiday": 275.5}
+    return {
+        f"{index:08d}": {
+            month: {shift: {"total": total, "allowance": total * rates[shift]}
+                    for shift in SHIFT_LIST if (total := rng.randint(0, 12))}
+            for month in months
+        }
+        for index in range(employees)
+    }
+
+
+def time_export(employee_months, months, fmt, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = SyntheticReport(employee_months, months).export(fmt).getvalue()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=5000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    months = list(range(1, args.months + 1))
+    employee_months = synthetic_months(args.employees, months)
+
+    print(f"{args.employees} employees x {args.months} months")
+    print(f"{'format':10} {'ms':>10} {'KB':>10} {'vs csv':>8}")
+    csv_size = None
+    for fmt in ("csv", "parquet", "xlsx"):
+        if not format_available(fmt):
+            print(f"{fmt:10} {'skipped (writer not installed)':>30}")
+            continue
+        seconds, size = time_export(employee_months, months, fmt, args.repeat)
+        csv_size = csv_size or size
+        print(f"{fmt:10} {seconds * 1000:10.1f} {size / 1024:10.1f} {size / csv_size:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare JSON encode time and bytes on the wire for a synthetic shift grid.
+
+    python -m benchmarks.bench_json --employees 1000 --repeat 20
+"""
+import argparse
+import gzip
+import random
+import statistics
+import time
+import uuid
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.serialization import FastJSONProvider, brotli, orjson
+
+SHIFTS = ["night", "afternoon", "general", "planned", "restricted", "holiday"]
+
+
+def synthetic_grid(employees, days=31, seed=0):
+    rng = random.Random(seed)
+    return {"shifts": [
+        {
+            "unique_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": f"Employee {index}",
+            "revision": rng.randint(1, 10_000),
+            "shifts": {f"day_{day}": {"shift": rng.choice(SHIFTS), "overwork": rng.random() < 0.05}
+                       for day in range(1, days + 1)},
+        }
+        for index in range(employees)
+    ], "revision": 10_000, "count": employees}
+
+
+def time_encode(provider, payload, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = provider.dumps(payload, separators=(",", ":"))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), body.encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    payload = synthetic_grid(args.employees)
+    providers = [("default", DefaultJSONProvider(app))]
+    if orjson is not None:
+        providers.append(("orjson", FastJSONProvider(app)))
+
+    print(f"{args.employees} employees x 31 days")
+    print(f"{'encoder':10} {'encode ms':>10} {'raw KB':>10} {'gzip KB':>10} {'br KB':>10}")
+    for name, provider in providers:
+        seconds, body = time_encode(provider, payload, args.repeat)
+        gzipped = len(gzip.compress(body, compresslevel=5))
+        brotlied = len(brotli.compress(body, quality=4)) if brotli is not None else float("nan")
+        print(f"{name:10} {seconds * 1000:10.2f} {len(body) / 1024:10.1f} {gzipped / 1024:10.1f} {brotlied / 1024:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import os
+
+import mongomock
+import pytest
+from pymongo import MongoClient
+
+from app import create_app, db
+
+
+@pytest.fixture
+def mock_db():
+    """`app.db` backed by an empty in-memory mongomock client."""
+    create_app({"MONGO_DB": "hrportal_test", "ENSURE_INDEXES": False})
+    db.use_client(mongomock.MongoClient())
+    return db
+
+
+@pytest.fixture
+def mongod_db():
+    """`app.db` on a real server from TEST_MONGO_URI, in a database dropped afterwards."""
+    uri = os.getenv("TEST_MONGO_URI")
+    if not uri:
+        pytest.skip("TEST_MONGO_URI is not set")
+
+    create_app({"MONGO_URI": uri, "MONGO_DB": "hrportal_test", "ENSURE_INDEXES": False})
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    client.drop_database("hrportal_test")
+    db.use_client(client)
+    yield db
+    client.drop_database("hrportal_test")
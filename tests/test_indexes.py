@@ -0,0 +1,25 @@
+from app.indexes import INDEXES, QUERIES, ensure_indexes, explain_queries
+
+
+def index_keys(database, collection):
+    return {tuple(index["key"].items()) for index in database[collection].list_indexes()}
+
+
+def test_ensure_indexes_twice(mock_db):
+    assert ensure_indexes() == []
+    assert ensure_indexes() == []
+
+    for collection, keys, _ in INDEXES:
+        assert tuple(keys) in index_keys(mock_db, collection)
+
+
+def test_model_queries_use_indexes(mongod_db):
+    # Every queried collection needs a document, or the plan is just EOF.
+    for collection in {collection for _, collection, _ in QUERIES}:
+        mongod_db[collection].insert_one({})
+
+    assert ensure_indexes() == []
+    assert ensure_indexes() == []
+
+    scans = [result["query"] for result in explain_queries() if result["collscan"]]
+    assert scans == []
@@ -0,0 +1,106 @@
+"""
+The pivot-based `Report.build_frame` must write the same CSV, byte for
+byte, as the row-by-row builder it replaced (`reference_csv` below), and
+the streamed CSV must be the same file.
+"""
+import calendar
+import io
+
+import pandas as pd
+import pytest
+
+from app.report.utils import Report
+
+
+def reference_csv(report_data, months):
+    """The original `convert_to_csv`: one concat + fillna per employee."""
+    header = ["name"]
+    shift_list = ["night", "afternoon", "holiday"]
+    shift_columns = []
+    for shift in shift_list:
+        for month in months:
+            header.append(f"{calendar.month_name[month]} ({shift})")
+        shift_columns.append(f"Total {shift} shift")
+        header.append(f"Total {shift} shift")
+    header.append("Total working days")
+    for shift in shift_list:
+        header.append(f"Total {shift} shift Allowance")
+
+    dataframe = pd.DataFrame(columns=header)
+    for employee, data in report_data.items():
+        row_data = {"name": employee}
+        for month, shift_data in data.items():
+            for shift, value in shift_data.items():
+                if f"{month} ({shift})" in header:
+                    row_data[f"{month} ({shift})"] = value["total"]
+                    if f"Total {shift} shift" in row_data.keys():
+                        row_data[f"Total {shift} shift"] += value["total"]
+                    else:
+                        row_data[f"Total {shift} shift"] = value["total"]
+                    if f"Total {shift} shift Allowance" in row_data.keys():
+                        row_data[f"Total {shift} shift Allowance"] += value["allowance"]
+                    else:
+                        row_data[f"Total {shift} shift Allowance"] = value["allowance"]
+        dataframe = pd.concat([dataframe, pd.DataFrame([row_data])], ignore_index=True)
+        dataframe.fillna(0, inplace=True)
+    dataframe["Total working days"] = dataframe[shift_columns].sum(axis=1)
+
+    csv_buffer = io.BytesIO()
+    dataframe.to_csv(csv_buffer, index=False)
+    return csv_buffer.getvalue()
+
+
+def shift(total, allowance):
+    return {"total": total, "allowance": allowance}
+
+
+CASES = {
+    "mixed whole and fractional allowances": ([1], {
+        "A": {"January": {"night": shift(2, 300)}},
+        "B": {"January": {"night": shift(1, 150.5)}},
+    }),
+    "several months and shifts": ([1, 2, 3], {
+        "A": {"January": {"night": shift(2, 300), "afternoon": shift(1, 100)},
+              "March": {"holiday": shift(1, 275.5), "night": shift(3, 450)}},
+        "B": {"February": {"afternoon": shift(4, 400)}},
+        "C": {"January": {}, "February": {}},
+    }),
+    "float amounts from the database": ([1, 2], {
+        "A": {"January": {"night": shift(2, 300.0)}, "February": {"night": shift(1, 0.1)}},
+        "B": {"February": {"night": shift(1, 0.2)}},
+    }),
+    "months and shifts outside the report are ignored": ([2], {
+        "A": {"January": {"night": shift(2, 300)}, "February": {"general": shift(5, 0), "night": shift(1, 150)}},
+    }),
+    "employee without paid days": ([1], {
+        "A": {"January": {}},
+    }),
+}
+
+
+def make_report(months, report_data):
+    # Employees are keyed by unique_id; here every unique_id is the employee's name.
+    report = Report(months, 2024, "team", roster={key: key for key in report_data}, rates={})
+    report.report_data = dict(report_data)
+    return report
+
+
+@pytest.mark.parametrize("months, report_data", CASES.values(), ids=CASES.keys())
+def test_csv_matches_reference_builder(months, report_data):
+    report = make_report(months, report_data)
+
+    assert report.convert_to_csv().getvalue() == reference_csv(report_data, months)
+
+
+@pytest.mark.parametrize("months, report_data", CASES.values(), ids=CASES.keys())
+def test_streamed_csv_matches_buffered(months, report_data):
+    report = make_report(months, report_data)
+    month_numbers = {name: number for number, name in enumerate(calendar.month_name)}
+    # What the cursor yields: one `(unique_id, {month: shift_dict})` per employee, in unique_id order.
+    report.iter_employee_months = lambda: iter([
+        (key, {month_numbers[month]: shifts for month, shifts in data.items()})
+        for key, data in sorted(report_data.items())
+    ])
+
+    streamed = "".join(report.stream_csv()).encode()
+    assert streamed == report.convert_to_csv().getvalue()
@@ -0,0 +1,54 @@
+"""
+The summary engine must not silently drop months whose summary is missing
+(not backfilled, or a failed refresh): those are computed from `shifts`.
+"""
+from app import db
+from app.report.utils import Report
+
+
+def summary(unique_id, month, shifts):
+    return {"_id": {"unique_id": unique_id, "year": 2024, "month": month},
+            "unique_id": unique_id, "year": 2024, "month": month, "shifts": shifts}
+
+
+def fail_aggregate(match):
+    raise AssertionError("raw shifts were aggregated although every month has a summary")
+
+
+def test_months_without_summary_fall_back_to_shifts(mock_db, monkeypatch):
+    for unique_id in ("a", "b", "c"):
+        for month in (1, 2):
+            db.shifts.insert_one({"unique_id": unique_id, "year": 2024, "month": month, "shifts": {}})
+    db.shift_summaries.insert_many([
+        summary("b", 1, [{"shift": "night", "total": 2, "allowance": 300}]),
+        summary("b", 2, []),
+    ])
+
+    computed = {"a": {1: {"night": {"total": 1, "allowance": 150}}, 2: {}},
+                "b": {1: {"night": {"total": 9, "allowance": 0}}, 2: {"night": {"total": 9, "allowance": 0}}},
+                "c": {2: {"afternoon": {"total": 1, "allowance": 100}}}}
+    asked = []
+
+    def aggregate_employee_months(match):
+        asked.append(match)
+        return iter(sorted(computed.items()))
+
+    report = Report([1, 2], 2024, "team", roster={"a": "A", "b": "B", "c": "C"}, rates={})
+    monkeypatch.setattr(report, "aggregate_employee_months", aggregate_employee_months)
+
+    assert list(report.iter_employee_months()) == [
+        ("a", {1: {"night": {"total": 1, "allowance": 150}}, 2: {}}),
+        ("b", {1: {"night": {"total": 2, "allowance": 300}}, 2: {}}),
+        ("c", {2: {"afternoon": {"total": 1, "allowance": 100}}}),
+    ]
+    assert asked[0]["unique_id"] == {"$in": ["a", "c"]}
+
+
+def test_complete_summaries_skip_the_fallback(mock_db, monkeypatch):
+    db.shifts.insert_one({"unique_id": "a", "year": 2024, "month": 1, "shifts": {}})
+    db.shift_summaries.insert_one(summary("a", 1, []))
+
+    report = Report([1], 2024, "team", roster={"a": "A"}, rates={})
+    monkeypatch.setattr(report, "aggregate_employee_months", fail_aggregate)
+
+    assert list(report.iter_employee_months()) == [("a", {1: {}})]
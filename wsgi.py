@@ -0,0 +1,10 @@
+"""
+Production WSGI entry point, e.g.::
+
+    gunicorn --workers 8 --preload wsgi:app
+
+Each worker opens its own MongoClient on first use after the fork.
+"""
+from app import create_app
+
+app = create_app()